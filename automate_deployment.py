@@ -1,4 +1,5 @@
 import os
+import sys
 import json
 import uuid
 from datetime import datetime
@@ -6,9 +7,12 @@ from pathlib import Path
 from config import (
     search_index_client, embedding_client,
     SEARCH_ENDPOINT,
-    SEARCH_KEY
+    SEARCH_KEY,
+    SEARCH_INDEX,
+    LOCAL_INDEX_DIR
 )
 from document_loader import process_document_with_di , upload_to_blob_storage 
+from vector_index import build_local_index
 from azure.search.documents.indexes.models import (
     SearchIndex,
     SimpleField,
@@ -101,6 +105,33 @@ def upload_documents_to_search(documents, index_name):
         print(f"Uploaded batch {i//batch_size + 1} of {len(search_documents)//batch_size + 1}")
 
     print(f"Uploaded {len(search_documents)} documents to search index")
+    return search_documents
+
+def export_local_index(search_documents, index_dir=LOCAL_INDEX_DIR):
+    """Write the uploaded documents and embeddings as a local vector index (RETRIEVAL_BACKEND=local)."""
+    ivf_lists = int(os.getenv('LOCAL_INDEX_IVF_LISTS', '0'))
+    build_local_index(
+        search_documents,
+        [doc['embedding'] for doc in search_documents],
+        index_dir,
+        ivf_lists=ivf_lists
+    )
+
+def export_local_index_from_search(index_name, index_dir=LOCAL_INDEX_DIR):
+    """Download an existing Azure AI Search index into a local vector index."""
+    from azure.search.documents import SearchClient
+    from azure.core.credentials import AzureKeyCredential
+
+    search_client = SearchClient(
+        endpoint=SEARCH_ENDPOINT,
+        index_name=index_name,
+        credential=AzureKeyCredential(SEARCH_KEY)
+    )
+    search_documents = list(search_client.search(search_text="*", select=['id', 'content', 'embedding']))
+    if not search_documents:
+        print("Search index is empty, nothing to export.")
+        return
+    export_local_index(search_documents, index_dir)
 
 
 
@@ -153,15 +184,26 @@ def main():
 
     # Upload documents to search index
     try:
-        upload_documents_to_search(processed_documents, index_name)
+        search_documents = upload_documents_to_search(processed_documents, index_name)
     except Exception as e:
         print(f"Error uploading documents to search: {e}")
         return
 
+    # Keep a local copy for the in-process retrieval backend
+    try:
+        export_local_index(search_documents)
+    except Exception as e:
+        print(f"Error exporting local vector index: {e}")
+
 
     print("Automation completed successfully!")
     print(f"New search index: {index_name}")
     print(f"Processed {len(processed_documents)} documents")
 
 if __name__ == "__main__":
-    main()
+    if "--export-local-index" in sys.argv:
+        # Optional index name after the flag; by default the index the chatbot searches
+        position = sys.argv.index("--export-local-index")
+        export_local_index_from_search(sys.argv[position + 1] if len(sys.argv) > position + 1 else SEARCH_INDEX)
+    else:
+        main()
@@ -0,0 +1,104 @@
+"""Micro-benchmark: session stores (legacy JSON files, append-only JSONL log, SQLite WAL).
+
+Run from the repository root:
+    python benchmarks/bench_session_store.py
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import session_manager
+import sqlite_store
+
+SIZES = [10, 1000, 10000]
+APPENDS = 50
+LAST_N = 20
+
+
+def legacy_save_message(sessions_dir, session_id, role, content):
+    session_file = os.path.join(sessions_dir, f"{session_id}.json")
+    messages = []
+    if os.path.exists(session_file):
+        with open(session_file, 'r') as f:
+            messages = json.load(f)
+    messages.append({"id": str(uuid.uuid4()), "role": role, "content": content})
+    with open(session_file, 'w') as f:
+        json.dump(messages, f, indent=4)
+
+
+def legacy_load_messages(sessions_dir, session_id):
+    with open(os.path.join(sessions_dir, f"{session_id}.json"), 'r') as f:
+        messages = json.load(f)
+    return [{"role": msg["role"], "content": msg["content"]} for msg in messages]
+
+
+def make_message(i):
+    role = "user" if i % 2 == 0 else "assistant"
+    return role, f"Message {i}: " + "Retrieval-augmented generation combines search with language models. " * 4
+
+
+def seed_legacy(sessions_dir, session_id, n):
+    messages = [{"id": str(uuid.uuid4()), "role": role, "content": content}
+                for role, content in map(make_message, range(n))]
+    with open(os.path.join(sessions_dir, f"{session_id}.json"), 'w') as f:
+        json.dump(messages, f, indent=4)
+
+
+def seed_log(session_id, n):
+    with open(session_manager._path(session_id, ".jsonl"), 'wb') as f:
+        for i in range(n):
+            f.write(session_manager._record(*make_message(i), tokens=0))
+    session_manager._rebuild_index(session_id)
+
+
+def seed_sqlite(session_id, n):
+    sqlite_store.save_messages(session_id, [make_message(i) for i in range(n)])
+
+
+def timed(fn, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    with tempfile.TemporaryDirectory() as sessions_dir:
+        session_manager.SESSIONS_DIR = sessions_dir
+        session_manager.SESSION_COMPACT_EVERY = 0
+        sqlite_store.SESSION_DB_PATH = os.path.join(sessions_dir, "sessions.db")
+
+        print(f"{'messages':>9} {'store':>7} {'append ms':>10} {'load all ms':>12} {f'last {LAST_N} ms':>11}")
+        for n in SIZES:
+            legacy_id, log_id, db_id = f"legacy-{n}", f"log-{n}", f"db-{n}"
+            seed_legacy(sessions_dir, legacy_id, n)
+            seed_log(log_id, n)
+            seed_sqlite(db_id, n)
+
+            role, content = make_message(n)
+            rows = [
+                ("json",
+                 timed(lambda: legacy_save_message(sessions_dir, legacy_id, role, content), APPENDS),
+                 timed(lambda: legacy_load_messages(sessions_dir, legacy_id), 5),
+                 timed(lambda: legacy_load_messages(sessions_dir, legacy_id)[-LAST_N:])),
+                ("jsonl",
+                 timed(lambda: session_manager.save_message(log_id, role, content), APPENDS),
+                 timed(lambda: session_manager.load_messages(log_id), 5),
+                 timed(lambda: session_manager.load_messages(log_id, LAST_N))),
+                ("sqlite",
+                 timed(lambda: sqlite_store.save_message(db_id, role, content), APPENDS),
+                 timed(lambda: sqlite_store.load_messages(db_id), 5),
+                 timed(lambda: sqlite_store.load_messages(db_id, LAST_N))),
+            ]
+            for name, append_ms, load_ms, last_ms in rows:
+                print(f"{n:>9} {name:>7} {append_ms:>10.3f} {load_ms:>12.3f} {last_ms:>11.3f}")
+        sqlite_store.close()
+
+
+if __name__ == "__main__":
+    main()
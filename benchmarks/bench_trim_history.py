@@ -0,0 +1,76 @@
+"""Micro-benchmark: legacy trim_history vs. incremental token accounting.
+
+Run from the repository root:
+    python benchmarks/bench_trim_history.py
+"""
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tiktoken
+from token_counter import get_encoding, message_tokens, trim_messages
+
+MAX_TOKENS = 4096
+
+
+def legacy_num_tokens_from_messages(messages, model="gpt-4o"):
+    try:
+        encoding = tiktoken.encoding_for_model(model)
+    except KeyError:
+        encoding = tiktoken.get_encoding("cl100k_base")
+
+    num_tokens = 0
+    for message in messages:
+        for _, value in message.items():
+            num_tokens += len(encoding.encode(value))
+    return num_tokens
+
+
+def legacy_trim_history(history):
+    total_tokens = legacy_num_tokens_from_messages(history, model="gpt-4o")
+    while total_tokens > MAX_TOKENS and len(history) > 1:
+        history.pop(0)
+        total_tokens = legacy_num_tokens_from_messages(history, model="gpt-4o")
+    return history
+
+
+def make_history(n):
+    history = []
+    for i in range(n):
+        role = "user" if i % 2 == 0 else "assistant"
+        content = f"Message {i}: " + "Retrieval-augmented generation combines search with language models. " * 4
+        history.append({"role": role, "content": content})
+    return history
+
+
+def with_stored_counts(history):
+    # Mirrors what the session stores persist next to each message
+    return [dict(msg, tokens=message_tokens(msg)) for msg in history]
+
+
+def timed(fn, history, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        copy = [dict(msg) for msg in history]
+        start = time.perf_counter()
+        fn(copy)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    get_encoding()  # load the encoder outside the timings
+    for n in (100, 1000):
+        plain = make_history(n)
+        stored = with_stored_counts(plain)
+        repeat = 5 if n <= 100 else 1
+        legacy = timed(legacy_trim_history, plain, repeat)
+        incremental = timed(lambda h: trim_messages(h, MAX_TOKENS), stored, repeat)
+        print(f"{n:>5} messages: legacy {legacy * 1000:9.2f} ms | incremental {incremental * 1000:7.3f} ms | "
+              f"speedup x{legacy / incremental:,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Calibrate RELEVANCE_MIN_SCORE on labelled queries.
+
+The input is a JSONL file of real user questions, one per line, labelled by
+hand: {"query": "...", "related": true}. Each query is run through the
+configured retrieval backend, and the script prints its best cosine score and
+the threshold that separates the related from the unrelated queries best
+(highest balanced accuracy), next to how the current setting does.
+
+Queries without content terms (greetings, "thanks") skip the gate and are
+left out.
+
+Run from the repository root:
+    python benchmarks/calibrate_relevance.py queries.jsonl [--top-k 3]
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def load_labelled(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def balanced_accuracy(scored, threshold):
+    """Mean of the share of related queries let through and unrelated queries stopped."""
+    related = [score for score, is_related in scored if is_related]
+    unrelated = [score for score, is_related in scored if not is_related]
+    passed = sum(score >= threshold for score in related) / len(related) if related else 1.0
+    stopped = sum(score < threshold for score in unrelated) / len(unrelated) if unrelated else 1.0
+    return (passed + stopped) / 2
+
+
+def best_threshold(scored):
+    """(threshold, balanced accuracy), trying the midpoints between neighbouring scores."""
+    scores = sorted({score for score, _ in scored})
+    candidates = [scores[0]] + [(a + b) / 2 for a, b in zip(scores, scores[1:])] + [scores[-1] + 1e-6]
+    return max(((t, balanced_accuracy(scored, t)) for t in candidates), key=lambda item: item[1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", help="JSONL file of {\"query\", \"related\"} lines")
+    parser.add_argument("--top-k", type=int, default=3, help="documents retrieved per query, as in a chat turn")
+    args = parser.parse_args()
+
+    from config import RELEVANCE_MIN_SCORE
+    from embedding_search import search_documents
+    from relevance import content_terms
+
+    scored = []
+    for item in load_labelled(args.path):
+        if not content_terms(item["query"]):
+            continue
+        docs = search_documents(item["query"], top_k=args.top_k)
+        score = max((doc["score"] for doc in docs), default=0.0)
+        scored.append((score, bool(item["related"])))
+        print(f"{score:.3f}  {'related' if item['related'] else 'unrelated':9}  {item['query']}")
+    if not scored:
+        sys.exit("No queries to calibrate on.")
+
+    threshold, accuracy = best_threshold(scored)
+    print(f"\nBest threshold: {threshold:.3f} (balanced accuracy {accuracy:.1%}, {len(scored)} queries)")
+    print(f"Current RELEVANCE_MIN_SCORE={RELEVANCE_MIN_SCORE}: "
+          f"balanced accuracy {balanced_accuracy(scored, RELEVANCE_MIN_SCORE):.1%}")
+
+
+if __name__ == "__main__":
+    main()
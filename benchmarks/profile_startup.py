@@ -0,0 +1,79 @@
+"""Startup profiler: what importing an entry point costs, by module (python -X importtime).
+
+Each target is imported in a fresh interpreter, like a cold Function worker.
+Run from the repository root:
+    python benchmarks/profile_startup.py                      # online-chat/init.py
+    python benchmarks/profile_startup.py chat_logic --top 30  # what the chat route adds
+    python benchmarks/profile_startup.py --max-ms 100         # exit 1 when slower
+
+tests/test_startup.py runs the same check on every test run.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_TARGET = """
+import importlib, importlib.util, sys, time
+sys.path.insert(0, {root!r})
+target = {target!r}
+sys.stderr.write("--- target\\n")
+start = time.perf_counter()
+if target.endswith(".py"):
+    spec = importlib.util.spec_from_file_location("profiled_entry_point", target)
+    spec.loader.exec_module(importlib.util.module_from_spec(spec))
+else:
+    importlib.import_module(target)
+print(f"{{(time.perf_counter() - start) * 1000:.1f}}")
+"""
+
+
+def profile(target):
+    """Import `target` in a child interpreter; returns (wall ms, [(cumulative us, self us, name)])."""
+    if target.endswith(".py"):
+        target = os.path.join(ROOT, target)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", IMPORT_TARGET.format(root=ROOT, target=target)],
+        capture_output=True, text=True, cwd=ROOT
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {target} failed:\n{result.stderr[-2000:]}")
+    modules = []
+    # Only what the target pulled in, not the interpreter's own startup (site, ...)
+    for line in result.stderr.split("--- target\n", 1)[-1].splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append((int(cumulative_us), int(self_us), name.rstrip()))  # indentation shows nesting
+    return float(result.stdout.strip().splitlines()[-1]), modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("targets", nargs="*", default=["online-chat/init.py"],
+                        help="module names or .py paths relative to the repository root")
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to list")
+    parser.add_argument("--max-ms", type=float, help="fail when a target takes longer to import")
+    args = parser.parse_args()
+
+    failed = False
+    for target in args.targets:
+        try:
+            wall_ms, modules = profile(target)
+        except RuntimeError as e:
+            sys.exit(str(e))
+        print(f"{target}: {wall_ms:.1f} ms, {len(modules)} modules imported")
+        print(f"  {'cumulative':>10} {'self':>8}  module")
+        for cumulative_us, self_us, name in sorted(modules, reverse=True)[:args.top]:
+            print(f"  {cumulative_us / 1000:8.1f}ms {self_us / 1000:6.1f}ms {name}")
+        if args.max_ms is not None and wall_ms > args.max_ms:
+            print(f"  over budget: {wall_ms:.1f} ms > {args.max_ms:.1f} ms")
+            failed = True
+        print()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,206 +1,413 @@
-import tiktoken
 from openai import RateLimitError
-from config import chat_client, CHAT_OAI_CLIENT
-from embedding_search import retrieve_relevant_docs
-import json
-import httpx
-from bs4 import BeautifulSoup
+import config
+from config import (chat_client, async_chat_client, EMBEDDING_DIM, SEMANTIC_CACHE_CAPACITY, SEMANTIC_CACHE_THRESHOLD,
+                    RELEVANCE_MIN_SCORE, RELEVANCE_THRESHOLD, SINGLE_FLIGHT_TIMEOUT_SECONDS)
+from embedding_search import get_query_embedding, aget_query_embedding
+from semantic_cache import SemanticCache
+from relevance import is_query_related
+from tools import execute_tool_calls, aexecute_tool_calls
+from token_counter import trim_messages
+from context_packer import pack_prompt, doc_text
+from single_flight import SingleFlight
+import time
+import threading
 
 MAX_TOKENS = 4096
 SUMMARIZE_AFTER = 100
+SUMMARY_KEEP_RECENT = 10     # newest messages always sent verbatim
+SUMMARY_REFRESH_EVERY = 10   # messages folded into the summary per update
 
 # Simple caches
-summary_cache = {}
 rag_cache = {}
 
-# -----------------------------
-# Token counter
-# -----------------------------
-def num_tokens_from_messages(messages, model="gpt-4o"):
-    try:
-        encoding = tiktoken.encoding_for_model(model)
-    except KeyError:
-        encoding = tiktoken.get_encoding("cl100k_base")
+# Answers reused across paraphrases of the same question
+semantic_cache = None
+if SEMANTIC_CACHE_CAPACITY > 0:
+    semantic_cache = SemanticCache(dim=EMBEDDING_DIM, capacity=SEMANTIC_CACHE_CAPACITY,
+                                   threshold=SEMANTIC_CACHE_THRESHOLD)
 
-    num_tokens = 0
-    for message in messages:
-        for _, value in message.items():
-            num_tokens += len(encoding.encode(value))
-    return num_tokens
+# The same question over the same documents, asked while its answer is still being
+# generated, waits for that answer (keyed like rag_cache)
+generation_flight = SingleFlight("generation", SINGLE_FLIGHT_TIMEOUT_SECONDS)
 
 # -----------------------------
 # Trim history if too long
 # -----------------------------
 def trim_history(history):
-    total_tokens = num_tokens_from_messages(history, model="gpt-4o")
-    while total_tokens > MAX_TOKENS and len(history) > 1:
-        history.pop(0)
-        total_tokens = num_tokens_from_messages(history, model="gpt-4o")
-    return history
+    return trim_messages(history, MAX_TOKENS)
+
+
+def _api_messages(messages):
+    """Strip bookkeeping fields (such as stored token counts) before calling the API."""
+    return [{"role": msg["role"], "content": msg["content"]} for msg in messages]
 
 # -----------------------------
 # Summarization
 # -----------------------------
-def summarize_conversation(history):
-    conversation_text = "\n".join([f"{msg['role']}: {msg['content']}" for msg in history])
-
-    if conversation_text in summary_cache:
-        return summary_cache[conversation_text]
-
-    messages = [
-        {"role": "system", "content": "Summarize the following conversation briefly."},
-        {"role": "user", "content": conversation_text}
-    ]
+def update_summary(previous_summary, new_messages):
+    """Fold new messages into a running summary; returns None if the model is unavailable."""
+    conversation_text = "\n".join([f"{msg['role']}: {msg['content']}" for msg in new_messages])
+    if previous_summary:
+        prompt = f"Current summary:\n{previous_summary}\n\nNew messages:\n{conversation_text}"
+        instruction = "Update the conversation summary with the new messages. Keep it brief."
+    else:
+        prompt = conversation_text
+        instruction = "Summarize the following conversation briefly."
 
     try:
         response = chat_client.chat.completions.create(
-            model=CHAT_OAI_CLIENT,  # deployment name, not endpoint
-            messages=messages,
+            model=config.CHAT_OAI_CLIENT,  # deployment name, not endpoint
+            messages=[
+                {"role": "system", "content": instruction},
+                {"role": "user", "content": prompt}
+            ],
             max_tokens=150,
             temperature=0.3
         )
-        summary = response.choices[0].message.content
-        summary_cache[conversation_text] = summary
-        return summary
+        return response.choices[0].message.content
     except RateLimitError:
-        return "Summary unavailable due to rate limiting."
+        return None
 
-# -----------------------------
-# Function calling: get_course_recommendations
-# -----------------------------
-def get_course_recommendations(query):
-    courses = []
 
-    # Scrape Coursera
-    coursera_url = f"https://www.coursera.org/search?query={query}"
+_summaries_in_progress = set()
+_summaries_lock = threading.Lock()
+
+
+def _refresh_summary(session_id, store, previous_summary, new_messages, cutoff):
+    """Fold new_messages (which end at position cutoff) into the checkpoint; returns the new summary or None."""
     try:
-        response = httpx.get(coursera_url, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
-        course_cards = soup.find_all('a', href=True)
-        for card in course_cards:
-            href = card['href']
-            if '/learn/' in href or '/specializations/' in href:
-                name = card.get_text(strip=True)
-                if name:
-                    courses.append({"name": name, "url": f"https://www.coursera.org{href}", "platform": "Coursera"})
-                if len(courses) >= 3:
-                    break
+        summary = update_summary(previous_summary, new_messages)
+        if summary:
+            store.save_summary(session_id, summary, cutoff)
+        return summary
     except Exception as e:
-        print(e) 
-
-    if not courses:
-        return "No courses found for your query."
+        print(f"Failed to update summary for session {session_id}: {e}")
+        return None
+    finally:
+        with _summaries_lock:
+            _summaries_in_progress.discard(session_id)
 
-    result = "Here are some courses I found:\n"
-    for course in courses[:5]:
-        result += f"- {course['name']} ({course['platform']}): {course['url']}\n"
-    return result
 
-import json
-from difflib import SequenceMatcher
+def load_history_window(session_id, store):
+    """Load only the messages a prompt can still use.
 
-def is_topic_related_to_documents(query_topic: str, documents: list, threshold: float = 0.001108) -> bool:
+    Once a session is long enough to be summarized, everything before the
+    summary checkpoint is replaced by the summary anyway, so only the
+    messages after it are read (a last-N query). Returns (messages, offset,
+    checkpoint): offset is the position of the first returned message in
+    the full history.
     """
-    Check if the query topic is semantically related to any retrieved document.
-    This uses simple fuzzy matching. You can replace this with embeddings for better accuracy.
+    total = store.count_messages(session_id)
+    if total <= SUMMARIZE_AFTER:
+        return store.load_messages(session_id), 0, None
+    checkpoint = store.load_summary(session_id) or {"summary": "", "covered": 0}
+    offset = min(checkpoint["covered"], total - SUMMARY_KEEP_RECENT)
+    return store.load_messages(session_id, last_n=total - offset), offset, checkpoint
+
+
+def build_history_with_summary(session_id, history, store, background=False, offset=0, checkpoint=None):
+    """Replace older messages with a rolling summary once the session is long.
+
+    The summary checkpoint (text plus how many leading messages it covers)
+    lives in the session store. Each update only sends the previous summary
+    and the messages added since the checkpoint, so the cost per turn stays
+    constant however long the session gets. Messages not yet folded into
+    the summary are kept verbatim. With background=True the update runs on a
+    thread and the current turn uses the existing checkpoint.
+
+    `history` may be a window of the full history starting at `offset`, as
+    returned by load_history_window; it must not start after the checkpoint.
     """
-    for doc in documents:
-        similarity = SequenceMatcher(None, query_topic.lower(), doc.lower()).ratio()
-        print(f"Similarity between '{query_topic}' and document: {similarity}")
-        if similarity > threshold:
-            print(f"Similarity between '{query_topic}' and document: {similarity}")
-            return True
-    return False
+    total = offset + len(history)
+    if total <= SUMMARIZE_AFTER:
+        return history
+
+    checkpoint = checkpoint or store.load_summary(session_id) or {"summary": "", "covered": 0}
+    summary = checkpoint["summary"]
+    cutoff = total - SUMMARY_KEEP_RECENT
+    covered = max(offset, min(checkpoint["covered"], cutoff))
+
+    if cutoff - covered >= SUMMARY_REFRESH_EVERY:
+        with _summaries_lock:
+            busy = session_id in _summaries_in_progress
+            if not busy:
+                _summaries_in_progress.add(session_id)
+        new_messages = history[covered - offset:cutoff - offset]
+        if background and not busy:
+            threading.Thread(
+                target=_refresh_summary,
+                args=(session_id, store, summary, new_messages, cutoff),
+                daemon=True
+            ).start()
+        elif not busy:
+            new_summary = _refresh_summary(session_id, store, summary, new_messages, cutoff)
+            if new_summary:
+                summary, covered = new_summary, cutoff
+
+    recent = history[covered - offset:]
+    if not summary:
+        return recent
+    return [{"role": "system", "content": f"Summary of earlier conversation: {summary}"}] + recent
 
 # -----------------------------
 # RAG response with function calling
 # -----------------------------
-def generate_rag_response(user_input, history, relevant_docs):
+SYSTEM_PROMPT = (
+    "You are an AI assistant specialized in AI. "
+    "When the answer exists in the retrieved documents, respond directly without mentioning the documents. "
+    "If the user asks about learning a topic that is related to the documents, use the get_course_recommendations function. "
+    "If the topic is unrelated, politely say the topic is outside the current scope. "
+    "Always provide references when possible. After each answer, ask if you can assist with anything else."
+)
+
+RAG_TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "get_course_recommendations",
+            "description": "Get course recommendations based on a query.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "query": {
+                        "type": "string",
+                        "description": "The search query for courses, e.g., 'python'"
+                    }
+                },
+                "required": ["query"]
+            }
+        }
+    }
+]
+
+NOT_RELATED_RESPONSE = "No additional information available."
+RATE_LIMITED_RESPONSE = "I'm currently unable to answer due to rate limiting. Please try again later."
+
+
+def _lookup_cached_response(user_input, relevant_docs):
+    """Return (cache_key, query_embedding, cached_response_or_None)."""
     cache_key = (user_input, tuple(relevant_docs))
     if cache_key in rag_cache:
-        return rag_cache[cache_key]
+        return cache_key, None, rag_cache[cache_key]
 
-    # Check if the user input is related to the documents
-    if not is_topic_related_to_documents(user_input, relevant_docs):
-        return "No additional information available."
-
-    # Prepare context
-    context_text = "\n\n".join(relevant_docs)
-    encoding = tiktoken.get_encoding("cl100k_base")
-    context_tokens = len(encoding.encode(context_text))
-    if context_tokens > MAX_TOKENS // 2:
-        context_text = context_text[:MAX_TOKENS // 2]
-
-    system_prompt = (
-        "You are an AI assistant specialized in AI. "
-        "When the answer exists in the retrieved documents, respond directly without mentioning the documents. "
-        "If the user asks about learning a topic that is related to the documents, use the get_course_recommendations function. "
-        "If the topic is unrelated, politely say the topic is outside the current scope. "
-        "Always provide references when possible. After each answer, ask if you can assist with anything else."
+    # Reuse the query embedding computed during retrieval (served from the embedding cache)
+    query_embedding = None
+    if semantic_cache is not None:
+        query_embedding = get_query_embedding(user_input)
+        return _semantic_lookup(cache_key, query_embedding, relevant_docs)
+    return cache_key, query_embedding, None
+
+
+async def _alookup_cached_response(user_input, relevant_docs):
+    cache_key = (user_input, tuple(relevant_docs))
+    if cache_key in rag_cache:
+        return cache_key, None, rag_cache[cache_key]
+    if semantic_cache is not None:
+        return _semantic_lookup(cache_key, await aget_query_embedding(user_input), relevant_docs)
+    return cache_key, None, None
+
+
+def _semantic_lookup(cache_key, query_embedding, relevant_docs):
+    cached = semantic_cache.lookup(query_embedding, relevant_docs)
+    if cached is not None:
+        rag_cache[cache_key] = cached
+    return cache_key, query_embedding, cached
+
+
+def _remember_response(cache_key, query_embedding, relevant_docs, result, elapsed):
+    rag_cache[cache_key] = result
+    if semantic_cache is not None:
+        semantic_cache.store(query_embedding, relevant_docs, result, elapsed)
+
+
+def _doc_texts(docs):
+    # Search results ({"content", "score"}) are only needed whole for packing; caches,
+    # the relevance gate and tools work on the text
+    return [doc_text(doc) for doc in docs]
+
+
+def _build_rag_messages(user_input, history, docs):
+    # Pack system prompt, documents (best score first), summary and recent history into the token budget
+    messages = pack_prompt(SYSTEM_PROMPT, docs, history, user_input, MAX_TOKENS)
+    return _api_messages(messages)
+
+
+def _completion_kwargs(messages):
+    return dict(
+        model=config.CHAT_OAI_CLIENT,
+        messages=messages,
+        max_tokens=500,
+        temperature=0.2,
+        top_p=0.9,
+        presence_penalty=0.6,
+        frequency_penalty=0.5,
+        tools=RAG_TOOLS,
+        tool_choice="auto"
     )
 
-    tools = [
-        {
-            "type": "function",
-            "function": {
-                "name": "get_course_recommendations",
-                "description": "Get course recommendations based on a query.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "query": {
-                            "type": "string",
-                            "description": "The search query for courses, e.g., 'python'"
-                        }
-                    },
-                    "required": ["query"]
-                }
-            }
-        }
-    ]
 
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "system", "content": f"Context from documents:\n{context_text}"}
-    ] + history[-10:] + [{"role": "user", "content": user_input}]
+def generate_rag_response(user_input, history, relevant_docs):
+    docs, relevant_docs = relevant_docs, _doc_texts(relevant_docs)
+    cache_key, query_embedding, cached = _lookup_cached_response(user_input, relevant_docs)
+    if cached is not None:
+        return cached
 
-    messages = trim_history(messages)
+    # Check if the user input is related to the documents
+    if not is_query_related(user_input, docs, RELEVANCE_MIN_SCORE, RELEVANCE_THRESHOLD):
+        return NOT_RELATED_RESPONSE
 
     try:
-        response = chat_client.chat.completions.create(
-            model=CHAT_OAI_CLIENT,
-            messages=messages,
-            max_tokens=500,
-            temperature=0.2,
-            top_p=0.9,
-            presence_penalty=0.6,
-            frequency_penalty=0.5,
-            tools=tools,
-            tool_choice="auto"
+        return generation_flight.do(cache_key, _generate, cache_key, query_embedding, user_input, history,
+                                    docs, relevant_docs)
+    except RateLimitError:
+        return RATE_LIMITED_RESPONSE
+    except Exception as e:
+        return str(e)
+
+
+def _generate(cache_key, query_embedding, user_input, history, docs, relevant_docs):
+    messages = _build_rag_messages(user_input, history, docs)
+
+    start = time.perf_counter()
+    response = chat_client.chat.completions.create(**_completion_kwargs(messages))
+
+    message = response.choices[0].message
+    result = message.content or ""
+
+    # Check if the model decided to call the course tool
+    if message.tool_calls:
+        result += execute_tool_calls(
+            [(tool_call.function.name, tool_call.function.arguments) for tool_call in message.tool_calls],
+            relevant_docs,
+            RELEVANCE_THRESHOLD
         )
 
-        message = response.choices[0].message
-        result = message.content or ""
+    _remember_response(cache_key, query_embedding, relevant_docs, result, time.perf_counter() - start)
+    return result
+
+
+def _read_chunk(chunk, tool_calls):
+    """Collect a stream chunk's tool-call deltas into tool_calls; returns its content text, if any."""
+    # Azure sends content-filter results in chunks without choices
+    if not chunk.choices:
+        return None
+    delta = chunk.choices[0].delta
+    if delta is None:
+        return None
+    for tool_delta in delta.tool_calls or []:
+        call = tool_calls.setdefault(tool_delta.index, ["", ""])
+        if tool_delta.function is not None:
+            call[0] += tool_delta.function.name or ""
+            call[1] += tool_delta.function.arguments or ""
+    return delta.content
+
+
+def generate_rag_response_stream(user_input, history, relevant_docs):
+    """Streaming variant of generate_rag_response that yields text chunks as they arrive.
+
+    Content deltas are yielded immediately. Tool-call deltas are assembled
+    by index while streaming and executed once the stream ends, and their
+    output is yielded last. Joining the chunks gives the same text that
+    generate_rag_response returns. A caller that asks while the same answer
+    is already streaming gets it in one piece once it is complete.
+    """
+    docs, relevant_docs = relevant_docs, _doc_texts(relevant_docs)
+    cache_key, query_embedding, cached = _lookup_cached_response(user_input, relevant_docs)
+    if cached is not None:
+        yield cached
+        return
+
+    if not is_query_related(user_input, docs, RELEVANCE_MIN_SCORE, RELEVANCE_THRESHOLD):
+        yield NOT_RELATED_RESPONSE
+        return
+
+    flight = None
+    try:
+        if generation_flight.timeout:
+            flight, leader = generation_flight.join(cache_key)
+            if not leader:
+                result = generation_flight.wait(cache_key, flight)
+                flight = None
+                if result is not None:
+                    yield result
+                    return
+
+        messages = _build_rag_messages(user_input, history, docs)
+        start = time.perf_counter()
+        stream = chat_client.chat.completions.create(stream=True, **_completion_kwargs(messages))
+
+        parts = []
+        tool_calls = {}  # index -> [name, arguments]
+        for chunk in stream:
+            content = _read_chunk(chunk, tool_calls)
+            if content:
+                parts.append(content)
+                yield content
 
-        # Check if the model decided to call the course tool
-        if message.tool_calls:
-            for tool_call in message.tool_calls:
-                if tool_call.function.name == "get_course_recommendations":
-                    args = json.loads(tool_call.function.arguments)
-                    query = args.get("query", "")
+        if tool_calls:
+            tool_text = execute_tool_calls([tuple(tool_calls[i]) for i in sorted(tool_calls)], relevant_docs,
+                                           RELEVANCE_THRESHOLD)
+            if tool_text:
+                parts.append(tool_text)
+                yield tool_text
 
-                    # Check if the query is relevant to retrieved docs
-                    if is_topic_related_to_documents(query, relevant_docs):
-                        course_response = get_course_recommendations(query)
-                        result += "\n\n" + course_response
-                    else:
-                        result += "\n\nThe topic you're asking about doesn't match the topics found in the current documents, so I can't recommend courses on that."
+        result = "".join(parts)
+        _remember_response(cache_key, query_embedding, relevant_docs, result, time.perf_counter() - start)
+        _finish_flight(flight, result)
 
-        rag_cache[cache_key] = result
-        return result
+    except RateLimitError as e:
+        _finish_flight(flight, error=e)
+        yield RATE_LIMITED_RESPONSE
+    except Exception as e:
+        _finish_flight(flight, error=e)
+        yield str(e)
+    finally:
+        # Closed mid-stream: waiters generate the answer themselves
+        _finish_flight(flight)
 
+
+def _finish_flight(flight, result=None, error=None):
+    """Release callers waiting on a streamed answer; a no-op once it has been released."""
+    if flight is not None:
+        generation_flight.finish(flight, result, error)
+
+
+# -----------------------------
+# Async variants (async Function handler)
+# -----------------------------
+async def agenerate_rag_response(user_input, history, relevant_docs):
+    """generate_rag_response() on the async client; the event loop serves other chats while it waits."""
+    docs, relevant_docs = relevant_docs, _doc_texts(relevant_docs)
+    cache_key, query_embedding, cached = await _alookup_cached_response(user_input, relevant_docs)
+    if cached is not None:
+        return cached
+
+    if not is_query_related(user_input, docs, RELEVANCE_MIN_SCORE, RELEVANCE_THRESHOLD):
+        return NOT_RELATED_RESPONSE
+
+    try:
+        return await generation_flight.ado(cache_key, _agenerate, cache_key, query_embedding, user_input, history,
+                                           docs, relevant_docs)
     except RateLimitError:
-        return "I'm currently unable to answer due to rate limiting. Please try again later."
+        return RATE_LIMITED_RESPONSE
     except Exception as e:
         return str(e)
+
+
+async def _agenerate(cache_key, query_embedding, user_input, history, docs, relevant_docs):
+    messages = _build_rag_messages(user_input, history, docs)
+
+    start = time.perf_counter()
+    response = await async_chat_client.chat.completions.create(**_completion_kwargs(messages))
+
+    message = response.choices[0].message
+    result = message.content or ""
+    if message.tool_calls:
+        result += await aexecute_tool_calls(
+            [(tool_call.function.name, tool_call.function.arguments) for tool_call in message.tool_calls],
+            relevant_docs,
+            RELEVANCE_THRESHOLD
+        )
+
+    _remember_response(cache_key, query_embedding, relevant_docs, result, time.perf_counter() - start)
+    return result
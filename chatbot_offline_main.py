@@ -1,49 +1,13 @@
 from openai import APIConnectionError, RateLimitError, APIStatusError
-from chat_logic import SUMMARIZE_AFTER, trim_history, summarize_conversation, generate_rag_response
-from speech_utils import recognize_speech, synthesize_speech
-from config import speech_config
-from embedding_search import retrieve_relevant_docs, embedding_cache
-from config import COSMOS_KEY , COSMOS_URI
+from chat_logic import generate_rag_response_stream
+from pipeline import prepare_turn, finish_turn, clear_session
+from embedding_search import embedding_cache
+from session_store import get_session_store
 import uuid
 
-# Load Cosmos DB config from environment variables
-COSMOS_URI = COSMOS_URI
-COSMOS_KEY = COSMOS_KEY
-DATABASE_NAME = "ChatbotDB"
-CONTAINER_NAME = "Sessions"
-
-# In-memory storage for sessions if Cosmos DB is not configured
-sessions = {}
+session_store = get_session_store()
 session_id = str(uuid.uuid4())
 
-from azure.cosmos import CosmosClient, PartitionKey
-# Initialize Cosmos DB client and container
-cosmos_client = CosmosClient(COSMOS_URI, COSMOS_KEY)
-database = cosmos_client.create_database_if_not_exists(DATABASE_NAME)
-container = database.create_container_if_not_exists(
-    id=CONTAINER_NAME,
-    partition_key=PartitionKey(path="/sessionId")
-)
-
-def save_message(session_id, role, content):
-    container.create_item({
-        "id": str(uuid.uuid4()),
-        "sessionId": session_id,
-        "role": role,
-        "content": content
-    })
-
-def load_messages(session_id):
-    query = f"SELECT c.role, c.content FROM c WHERE c.sessionId = '{session_id}' ORDER BY c._ts ASC"
-    items = list(container.query_items(query, enable_cross_partition_query=True))
-    return [{"role": i["role"], "content": i["content"]} for i in items]
-
-def clear_conversation(session_id):
-    query = f"SELECT c.id, c.sessionId FROM c WHERE c.sessionId = '{session_id}'"
-    items = list(container.query_items(query, enable_cross_partition_query=True))
-    for item in items:
-        container.delete_item(item["id"], partition_key=item["sessionId"])
-    
 def restart_session():
     global session_id
     session_id = str(uuid.uuid4())
@@ -59,6 +23,9 @@ response_cache = {}  # cache responses to avoid repeated API calls
 
 mode_input = input("Choose mode (voice/text): ").strip().lower()
 if mode_input == "voice":
+    # The Speech SDK is only loaded (and its secrets fetched) in voice mode
+    from speech_utils import recognize_speech, synthesize_speech
+    from config import speech_config
     voice_mode = True
     print("Voice mode enabled. Speak your queries after the prompt.\n")
 else:
@@ -79,7 +46,7 @@ while True:
         print("Chatbot: Ending the conversation. Have a great day!")
         break
     if cmd == "clear":
-        clear_conversation(session_id)
+        clear_session(session_id, session_store)
         response_cache.clear()
         print("Chatbot: Conversation cleared! Let's start fresh.")
         continue
@@ -89,7 +56,7 @@ while True:
         print("Chatbot: Session restarted! Ready for a new conversation.")
         continue
     if cmd == "show history":
-        history = load_messages(session_id)
+        history = session_store.load_messages(session_id)
         if not history:
             print("Chatbot: No messages found for this session.")
         else:
@@ -106,29 +73,27 @@ while True:
             synthesize_speech(speech_config, response)
         continue
 
-    save_message(session_id, "user", user_input)
-
-    # Load and summarize history if needed
-    history = load_messages(session_id)
-    if len(history) > SUMMARIZE_AFTER:
-        summary_text = summarize_conversation(history[:-10])
-        history = [{"role": "system", "content": f"Summary of earlier conversation: {summary_text}"}] + history[-10:]
-
-    history = trim_history(history)
-
     try:
-        # Retrieve relevant docs (top_k reduced to 3)
-       
-        relevant_docs = retrieve_relevant_docs(user_input, top_k=3)
-     
+        # Retrieve relevant docs (top_k reduced to 3) while history and summary load;
+        # the whole turn is saved once the answer is complete
+        turn = prepare_turn(session_id, user_input, session_store, top_k=3, background_summary=True)
+        history, relevant_docs = turn.history, turn.relevant_docs
+
         print(f"Embedding retrieval successful. Found {len(relevant_docs)} documents.")
 
-        # Generate RAG response using the retrieved docs
-        response = generate_rag_response(user_input, history, relevant_docs)
-        print(f"Chatbot: {response}\n")
+        # Stream the RAG response using the retrieved docs
+        parts = []
+        for chunk in generate_rag_response_stream(user_input, history, relevant_docs):
+            if not parts:
+                print("Chatbot: ", end="", flush=True)
+            parts.append(chunk)
+            print(chunk, end="", flush=True)
+        print("\n")
+        response = "".join(parts)
 
         # Save response and cache it
-        save_message(session_id, "assistant", response)
+        finish_turn(turn, response)
+        print(f"Stage timings: {turn.format_timings()}")
         response_cache[user_input] = response
 
         if voice_mode:
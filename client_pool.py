@@ -0,0 +1,178 @@
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+from openai import APIConnectionError, APIStatusError, RateLimitError
+
+# -----------------------------
+# Latency-aware routing across Azure OpenAI deployments
+# -----------------------------
+class Deployment:
+    """One endpoint/deployment with its own client, quota and health statistics."""
+
+    def __init__(self, name, client, alpha=0.3):
+        self.name = name
+        self.client = client  # a GovernedClient, so each deployment keeps its own quota
+        self.alpha = alpha
+
+        self.ewma_latency = None
+        self.error_rate = 0.0  # EWMA of 429/5xx/connection failures
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.calls = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def record(self, latency=None, failed=False, failure_threshold=3, cooldown=30.0):
+        with self._lock:
+            self.calls += 1
+            self.error_rate = (1 - self.alpha) * self.error_rate + self.alpha * (1.0 if failed else 0.0)
+            if failed:
+                self.failures += 1
+                self.consecutive_failures += 1
+                if self.consecutive_failures >= failure_threshold:
+                    self.open_until = time.monotonic() + cooldown
+                    print(f"[{self.name}] circuit open for {cooldown:.0f}s after {self.consecutive_failures} failures")
+            else:
+                self.consecutive_failures = 0
+                self.open_until = 0.0
+                if latency is not None:
+                    self.ewma_latency = latency if self.ewma_latency is None else (
+                        (1 - self.alpha) * self.ewma_latency + self.alpha * latency)
+
+    def is_open(self, now):
+        return self.open_until > now
+
+    def expected_seconds(self, now):
+        """Estimated time to an answer: queueing/backoff wait plus latency, penalized by errors and low quota."""
+        governor = self.client.governor
+        latency = self.ewma_latency or 0.0  # unmeasured deployments are tried first
+        wait = governor.paused_for(now)
+        quota_left = governor.tokens.tokens / governor.tokens.capacity if governor.tokens.capacity else 1.0
+        return wait + latency * (1 + 2 * self.error_rate) * (2 - quota_left)
+
+    def stats(self):
+        return {
+            "ewma_latency": self.ewma_latency,
+            "error_rate": self.error_rate,
+            "circuit_open": self.is_open(time.monotonic()),
+            "calls": self.calls,
+            "failures": self.failures,
+        }
+
+
+def _retriable(error):
+    if isinstance(error, (RateLimitError, APIConnectionError)):
+        return True
+    return isinstance(error, APIStatusError) and error.status_code >= 500
+
+
+class _PooledResource:
+    def __init__(self, pool, path):
+        self._pool = pool
+        self._path = path
+
+    def create(self, **kwargs):
+        return self._pool.call(self._path, **kwargs)
+
+
+class _AsyncPooledResource(_PooledResource):
+    async def create(self, **kwargs):
+        return await self._pool.acall(self._path, **kwargs)
+
+
+class ClientPool:
+    """Drop-in replacement for a single client that routes each call to the healthiest deployment.
+
+    Each call goes to the deployment with the lowest expected time to answer,
+    based on its EWMA latency, recent 429/5xx rate, remaining quota and any
+    backoff in progress; a small `explore` share of calls goes to a random
+    healthy deployment so stale latencies get refreshed. After
+    failure_threshold consecutive failures a deployment's circuit opens for
+    `cooldown` seconds. A failed call fails over to the next best deployment.
+    Client errors (4xx other than 429) are raised immediately.
+    """
+
+    resource_class = _PooledResource
+
+    def __init__(self, deployments, failure_threshold=3, cooldown=30.0, max_attempts=None, explore=0.05):
+        if not deployments:
+            raise ValueError("ClientPool needs at least one deployment")
+        self.deployments = deployments
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_attempts = max_attempts or len(deployments) + 2
+        self.explore = explore
+
+        self.chat = SimpleNamespace(completions=self.resource_class(self, ("chat", "completions")))
+        self.embeddings = self.resource_class(self, ("embeddings",))
+
+    def choose(self, exclude=()):
+        now = time.monotonic()
+        candidates = [d for d in self.deployments if d not in exclude] or list(self.deployments)
+        closed = [d for d in candidates if not d.is_open(now)]
+        if not closed:
+            # Everything is open: probe the deployment whose cooldown ends first (half-open)
+            return min(candidates, key=lambda d: d.open_until)
+        if len(closed) > 1 and random.random() < self.explore:
+            return random.choice(closed)
+        return min(closed, key=lambda d: d.expected_seconds(now))
+
+    def _resource(self, deployment, path):
+        resource = deployment.client
+        for attr in path:
+            resource = getattr(resource, attr)
+        return resource
+
+    def _failed(self, deployment, error, tried):
+        """Record a failed call; raises non-retriable errors, else returns the deployments to skip next."""
+        if not _retriable(error):
+            raise error
+        deployment.record(failed=True, failure_threshold=self.failure_threshold, cooldown=self.cooldown)
+        print(f"[{deployment.name}] call failed ({type(error).__name__}), failing over")
+        tried = tried + [deployment]
+        return [] if len(tried) >= len(self.deployments) else tried
+
+    def call(self, path, **kwargs):
+        tried = []
+        last_error = None
+        for _ in range(self.max_attempts):
+            deployment = self.choose(exclude=tried)
+            start = time.perf_counter()
+            try:
+                result = self._resource(deployment, path).create(**kwargs)
+            except Exception as e:
+                tried = self._failed(deployment, e, tried)
+                last_error = e
+                continue
+            deployment.record(latency=time.perf_counter() - start,
+                              failure_threshold=self.failure_threshold, cooldown=self.cooldown)
+            return result
+        raise last_error
+
+    def stats(self):
+        return {d.name: d.stats() for d in self.deployments}
+
+
+class AsyncClientPool(ClientPool):
+    """ClientPool over AsyncGovernedClients: `await pool.chat.completions.create(...)`."""
+
+    resource_class = _AsyncPooledResource
+
+    async def acall(self, path, **kwargs):
+        tried = []
+        last_error = None
+        for _ in range(self.max_attempts):
+            deployment = self.choose(exclude=tried)
+            start = time.perf_counter()
+            try:
+                result = await self._resource(deployment, path).create(**kwargs)
+            except Exception as e:
+                tried = self._failed(deployment, e, tried)
+                last_error = e
+                continue
+            deployment.record(latency=time.perf_counter() - start,
+                              failure_threshold=self.failure_threshold, cooldown=self.cooldown)
+            return result
+        raise last_error
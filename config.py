@@ -1,15 +1,16 @@
-from azure.identity import DefaultAzureCredential
-from azure.keyvault.secrets import SecretClient
-from azure.search.documents import SearchClient
-from azure.search.documents.indexes import SearchIndexClient
-from azure.ai.documentintelligence import DocumentIntelligenceClient
-from azure.core.credentials import AzureKeyCredential
-from azure.storage.blob import BlobServiceClient
-import azure.cognitiveservices.speech as speechsdk
-from openai import AzureOpenAI
+import time
+
+_import_started = time.perf_counter()
+
 from dotenv import load_dotenv
 from urllib.parse import urlparse, urlunparse, urlencode, parse_qsl
+from concurrent.futures import ThreadPoolExecutor
+import base64
+import hashlib
+import json
 import os
+import tempfile
+import threading
 
 load_dotenv()
 
@@ -18,18 +19,204 @@ load_dotenv()
 # -----------------------------
 keyvault_url = os.getenv('keyvault_url')
 
-# Authenticate
-credential = DefaultAzureCredential()
-secret_client = SecretClient(vault_url=keyvault_url, credential=credential)
+# Query-embedding cache (memory LRU + optional memory-mapped disk tier)
+EMBEDDING_DIM = 3072  # text-embedding-3-large
+EMBEDDING_CACHE_MAX_MB = float(os.getenv('EMBEDDING_CACHE_MAX_MB', '64'))
+EMBEDDING_CACHE_TTL_SECONDS = float(os.getenv('EMBEDDING_CACHE_TTL_SECONDS', '0'))  # 0 = never expire
+EMBEDDING_CACHE_DIR = os.getenv('EMBEDDING_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'chatbot-embedding-cache'))  # empty = memory only
+EMBEDDING_CACHE_DISK_CAPACITY = int(os.getenv('EMBEDDING_CACHE_DISK_CAPACITY', '20000'))
 
+# Micro-batching of concurrent embedding requests (max wait 0 = no batching)
+EMBEDDING_BATCH_MAX_SIZE = int(os.getenv('EMBEDDING_BATCH_MAX_SIZE', '16'))
+EMBEDDING_BATCH_MAX_WAIT_MS = float(os.getenv('EMBEDDING_BATCH_MAX_WAIT_MS', '5'))
 
-def get_secret(name: str) -> str:
-    """Retrieve secret from Key Vault."""
+# Retrieval backend: "azure_search" (network) or "local" (memory-mapped index built by automate_deployment.py)
+RETRIEVAL_BACKEND = os.getenv('RETRIEVAL_BACKEND', 'azure_search')
+LOCAL_INDEX_DIR = os.getenv('LOCAL_INDEX_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'vector_index'))
+LOCAL_INDEX_MODE = os.getenv('LOCAL_INDEX_MODE', 'exact')  # "exact" or "ivf"
+LOCAL_INDEX_NPROBE = int(os.getenv('LOCAL_INDEX_NPROBE', '4'))
+
+# Semantic answer cache (capacity 0 = disabled)
+SEMANTIC_CACHE_CAPACITY = int(os.getenv('SEMANTIC_CACHE_CAPACITY', '1000'))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.92'))
+
+# Relevance gate: a question is answered when its best retrieved document has at least this
+# cosine similarity. 0.3 sits between the similarity text-embedding-3-large gives unrelated text
+# (about 0.1-0.2) and on-topic passages (about 0.4 and up); recalibrate it for your corpus on
+# labelled queries with benchmarks/calibrate_relevance.py.
+RELEVANCE_MIN_SCORE = float(os.getenv('RELEVANCE_MIN_SCORE', '0.3'))
+# Term gate, for course-tool queries and documents without a retrieval score: share of a
+# query's content terms that must appear in a retrieved document
+RELEVANCE_THRESHOLD = float(os.getenv('RELEVANCE_THRESHOLD', '0.25'))
+
+# Single-flight: concurrent identical embedding/search/answer calls share one execution;
+# waiters give up after this long and call directly (0 = no coalescing)
+SINGLE_FLIGHT_TIMEOUT_SECONDS = float(os.getenv('SINGLE_FLIGHT_TIMEOUT_SECONDS', '30'))
+
+# Course recommendation tool (base URL can point at a local fixture server)
+COURSERA_BASE_URL = os.getenv('COURSERA_BASE_URL', 'https://www.coursera.org').rstrip('/')
+COURSE_CACHE_TTL_SECONDS = float(os.getenv('COURSE_CACHE_TTL_SECONDS', '3600'))
+
+# Client-side rate limits per deployment (set to the deployment quota)
+CHAT_RPM = int(os.getenv('CHAT_RPM', '300'))
+CHAT_TPM = int(os.getenv('CHAT_TPM', '50000'))
+EMBEDDING_RPM = int(os.getenv('EMBEDDING_RPM', '300'))
+EMBEDDING_TPM = int(os.getenv('EMBEDDING_TPM', '50000'))
+RATE_LIMIT_MAX_WAIT_SECONDS = float(os.getenv('RATE_LIMIT_MAX_WAIT_SECONDS', '30'))
+RATE_LIMIT_MAX_RETRIES = int(os.getenv('RATE_LIMIT_MAX_RETRIES', '4'))
+
+# Session store: "cosmos", "sqlite" (SESSION_DB_PATH) or "file" (sessions/ directory)
+SESSION_STORE = os.getenv('SESSION_STORE', 'cosmos')
+SESSION_SOFT_DELETE = os.getenv('SESSION_SOFT_DELETE', '1') == '1'  # clear = one metadata patch + background purge
+SESSION_CACHE_SIZE = int(os.getenv('SESSION_CACHE_SIZE', '256'))  # recent sessions kept in memory, 0 = no cache
+SESSION_WRITE_BEHIND = os.getenv('SESSION_WRITE_BEHIND', '0') == '1'  # save turns on a background queue
+SESSION_DB_PATH = os.getenv('SESSION_DB_PATH', 'sessions.db')  # SQLite database of the sqlite store
+WRITE_BEHIND_MAX_PENDING = int(os.getenv('WRITE_BEHIND_MAX_PENDING', '1000'))
+
+# Extra deployments to route across, as JSON lists of
+# {"name", "endpoint", "key_secret" or "api_key", "rpm", "tpm"}; empty = single deployment
+CHAT_DEPLOYMENTS = json.loads(os.getenv('CHAT_DEPLOYMENTS', '[]'))
+EMBEDDING_DEPLOYMENTS = json.loads(os.getenv('EMBEDDING_DEPLOYMENTS', '[]'))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '3'))
+CIRCUIT_COOLDOWN_SECONDS = float(os.getenv('CIRCUIT_COOLDOWN_SECONDS', '30'))
+
+# Key Vault secrets: fetched concurrently on first use, optionally cached in an
+# encrypted local file so a recycled worker skips Key Vault (needs SECRET_CACHE_KEY)
+SECRET_FETCH_CONCURRENCY = int(os.getenv('SECRET_FETCH_CONCURRENCY', '16'))
+SECRET_CACHE_KEY = os.getenv('SECRET_CACHE_KEY', '')  # empty = no local cache
+SECRET_CACHE_TTL_SECONDS = float(os.getenv('SECRET_CACHE_TTL_SECONDS', '300'))
+SECRET_CACHE_PATH = os.getenv('SECRET_CACHE_PATH', os.path.join(tempfile.gettempdir(), 'chatbot-secrets.bin'))
+
+# Cold-start breakdown: seconds spent importing config, fetching secrets and building each client
+STARTUP_TIMINGS = {}
+
+
+# -----------------------------
+# Key Vault secrets
+# -----------------------------
+SECRETS = {
+    "OAI_ENDPOINT": "oai-internship-eus2-endpoint",
+    "CHAT_OAI_ENDPOINT": "gpt-4o-deployment-endpoint",
+    "EMBEDDING_OAI_ENDPOINT": "text-embedding-3-large-deployment-endpoint",
+    "OAI_KEY": "oai-internship-eus2-key1",
+    "DI_ENDPOINT": "text-embedding-3-large-deployment-endpoint",
+    "DI_KEY": "di-internship-eus2-key1",
+    "BLOB_CONN": "sainternshipeus-connection-string",
+    "SPEECH_ENDPOINT": "sps-internship-eus2-endpoint",
+    "SPEECH_KEY": "sps-internship-eus2-key1",
+    "SEARCH_ENDPOINT": "ss-internship-eus2-endpoint",
+    "SEARCH_KEY": "ss-internship-eus2-key1",
+    "COSMOS_URI": "cosmosdb-internship-wus2-uri",
+    "COSMOS_KEY": "cosmosdb-internship-wus2-primary-key",
+    "REALTIME_ENDPOINT": "gpt-realtime-endpoint",
+    "REALTIME_KEY": "oai-internship-eus2-key1",
+}
+
+_secret_values = {}   # Key Vault name -> value
+_secret_errors = {}   # Key Vault name -> exception from the last fetch
+_secret_lock = threading.Lock()
+_secret_client = None
+_secrets_loaded = False
+
+
+def _timed(stage, fn, *args):
+    start = time.perf_counter()
     try:
-        return secret_client.get_secret(name).value
+        return fn(*args)
+    finally:
+        STARTUP_TIMINGS[stage] = STARTUP_TIMINGS.get(stage, 0.0) + time.perf_counter() - start
+
+
+def _get_secret_client():
+    global _secret_client
+    if _secret_client is None:
+        from azure.identity import DefaultAzureCredential
+        from azure.keyvault.secrets import SecretClient
+        _secret_client = SecretClient(vault_url=keyvault_url, credential=DefaultAzureCredential())
+    return _secret_client
+
+
+def _cache_cipher():
+    from cryptography.fernet import Fernet  # installed with azure-identity
+    key = base64.urlsafe_b64encode(hashlib.sha256(SECRET_CACHE_KEY.encode()).digest())
+    return Fernet(key)
+
+
+def _read_secret_cache():
+    if not SECRET_CACHE_KEY or SECRET_CACHE_TTL_SECONDS <= 0:
+        return {}
+    try:
+        with open(SECRET_CACHE_PATH, 'rb') as f:
+            token = f.read()
+        # Fernet tokens carry their creation time, so the TTL check needs no extra metadata
+        return json.loads(_cache_cipher().decrypt(token, ttl=int(SECRET_CACHE_TTL_SECONDS)))
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"Ignoring local secret cache: {e!r}")
+        return {}
+
+
+def _write_secret_cache(values):
+    if not SECRET_CACHE_KEY or SECRET_CACHE_TTL_SECONDS <= 0:
+        return
+    try:
+        token = _cache_cipher().encrypt(json.dumps(values).encode())
+        tmp = f"{SECRET_CACHE_PATH}.{os.getpid()}.tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(token)
+        os.replace(tmp, SECRET_CACHE_PATH)
     except Exception as e:
-        print(f" Failed to retrieve secret {name}: {e}")
-        raise
+        print(f"Could not write local secret cache: {e}")
+
+
+def load_secrets(names=None):
+    """Fetch Key Vault secrets that are not loaded yet, all at once.
+
+    The first call loads every secret in SECRETS (plus `names`) concurrently,
+    so the whole set costs about one Key Vault round trip; the local cache,
+    when enabled, is tried first. Failures are kept per secret, raised when
+    that secret is used and retried when it is asked for again.
+    """
+    global _secrets_loaded
+    with _secret_lock:
+        wanted = set(names or ()) if _secrets_loaded else set(SECRETS.values()) | set(names or ())
+        _secrets_loaded = True
+        missing = wanted - _secret_values.keys()
+        if not missing:
+            return
+        if not _secret_values:
+            _secret_values.update(_timed("secret_cache", _read_secret_cache))
+            missing -= _secret_values.keys()
+        if not missing:
+            return
+
+        client = _get_secret_client()
+
+        def fetch_all():
+            with ThreadPoolExecutor(max_workers=max(1, min(SECRET_FETCH_CONCURRENCY, len(missing)))) as executor:
+                futures = {name: executor.submit(lambda n: client.get_secret(n).value, name) for name in missing}
+            for name, future in futures.items():
+                try:
+                    _secret_values[name] = future.result()
+                    _secret_errors.pop(name, None)
+                except Exception as e:
+                    print(f" Failed to retrieve secret {name}: {e}")
+                    _secret_errors[name] = e
+
+        _timed("secrets", fetch_all)
+        STARTUP_TIMINGS["secrets_fetched"] = STARTUP_TIMINGS.get("secrets_fetched", 0) + len(missing)
+        if missing - _secret_errors.keys():
+            _write_secret_cache(_secret_values)
+
+
+def get_secret(name: str) -> str:
+    """Retrieve secret from Key Vault."""
+    load_secrets([name])
+    if name in _secret_errors:
+        raise _secret_errors[name]
+    return _secret_values[name]
 
 
 def get_region_from_endpoint(endpoint: str) -> str:
@@ -40,57 +227,225 @@ def get_region_from_endpoint(endpoint: str) -> str:
         return "eastus2"
 
 
+_governors = {}  # deployment label -> RateGovernor, shared by its sync and async clients
+_governors_lock = threading.Lock()
+
+
+def _governor(label, rpm, tpm, max_retries):
+    from rate_limiter import RateGovernor
+    with _governors_lock:
+        if label not in _governors:
+            _governors[label] = RateGovernor(label, rpm, tpm, max_wait=RATE_LIMIT_MAX_WAIT_SECONDS, max_retries=max_retries)
+        return _governors[label]
+
+
+def build_openai_client(name, primary_url, api_key, api_version, rpm, tpm, extra_deployments, path, asynchronous=False):
+    """One governed client, or a ClientPool when extra deployments are configured.
+
+    Each extra deployment's endpoint gets the same API path (e.g. "/embeddings?api-version=...")
+    as the primary. In a pool, a 429 fails over to another deployment instead of
+    being retried in place. With asynchronous=True the client wraps AsyncAzureOpenAI
+    and shares each deployment's rate governor with the synchronous client.
+    """
+    from openai import AzureOpenAI, AsyncAzureOpenAI
+    from rate_limiter import GovernedClient, AsyncGovernedClient
+    from client_pool import ClientPool, AsyncClientPool, Deployment
+
+    sdk_class, client_class = (AsyncAzureOpenAI, AsyncGovernedClient) if asynchronous else (AzureOpenAI, GovernedClient)
+    pool_class = AsyncClientPool if asynchronous else ClientPool
+
+    def governed(label, base_url, key, deployment_rpm, deployment_tpm, max_retries):
+        # Retries on 429 are handled by the rate governors (or the pool), not the SDK
+        return client_class(
+            sdk_class(base_url=base_url, api_key=key, api_version=api_version, max_retries=0),
+            _governor(label, deployment_rpm, deployment_tpm, max_retries)
+        )
+
+    if not extra_deployments:
+        return governed(name, primary_url, api_key, rpm, tpm, RATE_LIMIT_MAX_RETRIES)
+
+    deployments = [Deployment(name, governed(name, primary_url, api_key, rpm, tpm, 0))]
+    for i, spec in enumerate(extra_deployments, start=1):
+        label = spec.get("name") or f"{name}-{i}"
+        key = spec.get("api_key") or get_secret(spec["key_secret"])
+        client = governed(label, spec["endpoint"].rstrip("/") + path, key,
+                          spec.get("rpm", rpm), spec.get("tpm", tpm), 0)
+        deployments.append(Deployment(label, client))
+    return pool_class(
+        deployments,
+        failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+        cooldown=CIRCUIT_COOLDOWN_SECONDS,
+        max_attempts=len(deployments) + RATE_LIMIT_MAX_RETRIES
+    )
+
+
 # -----------------------------
-# Initialize Azure Clients using Key Vault secrets
+# Azure clients, built on first use
 # -----------------------------
+# Each client is created (and its SDK imported) the first time it is used, so
+# the chat path never pays for Speech, Document Intelligence or Blob Storage.
+# Modules import the clients as usual; they are placeholders until then.
+SEARCH_INDEX = os.getenv('SEARCH_INDEX', "chatbot-docs-20250913_145142")
+
+
+def _chat_deployment_url():
+    return get_secret(SECRETS["CHAT_OAI_ENDPOINT"]) + "/chat/completions?api-version=2025-01-01-preview"
+
+
+def _embedding_deployment_url():
+    return get_secret(SECRETS["EMBEDDING_OAI_ENDPOINT"]) + "/embeddings?api-version=2023-05-15"
+
+
+def _build_chat_client():
+    print("CHAT_OAI_CLIENT : ", _lookup("CHAT_OAI_CLIENT"))
+    return build_openai_client(
+        "chat", _lookup("CHAT_OAI_CLIENT"), _lookup("OAI_KEY"), "2024-12-01-preview", CHAT_RPM, CHAT_TPM,
+        CHAT_DEPLOYMENTS, "/chat/completions?api-version=2025-01-01-preview"
+    )
+
+
+def _build_embedding_client():
+    print("EMBEDDED_OAI_CLIENT : ", _lookup("EMBEDDED_OAI_CLIENT"))
+    return build_openai_client(
+        "embedding", _lookup("EMBEDDED_OAI_CLIENT"), _lookup("OAI_KEY"), "2023-05-15", EMBEDDING_RPM, EMBEDDING_TPM,
+        EMBEDDING_DEPLOYMENTS, "/embeddings?api-version=2023-05-15"
+    )
+
+
+def _build_async_chat_client():
+    return build_openai_client(
+        "chat", _lookup("CHAT_OAI_CLIENT"), _lookup("OAI_KEY"), "2024-12-01-preview", CHAT_RPM, CHAT_TPM,
+        CHAT_DEPLOYMENTS, "/chat/completions?api-version=2025-01-01-preview", asynchronous=True
+    )
+
+
+def _build_async_embedding_client():
+    return build_openai_client(
+        "embedding", _lookup("EMBEDDED_OAI_CLIENT"), _lookup("OAI_KEY"), "2023-05-15", EMBEDDING_RPM, EMBEDDING_TPM,
+        EMBEDDING_DEPLOYMENTS, "/embeddings?api-version=2023-05-15", asynchronous=True
+    )
+
+
+def _build_di_client():
+    from azure.ai.documentintelligence import DocumentIntelligenceClient
+    from azure.core.credentials import AzureKeyCredential
+    return DocumentIntelligenceClient(endpoint=_lookup("DI_ENDPOINT"), credential=AzureKeyCredential(_lookup("DI_KEY")))
+
+
+def _build_blob_service_client():
+    from azure.storage.blob import BlobServiceClient
+    return BlobServiceClient.from_connection_string(_lookup("BLOB_CONN"))
+
+
+def _build_speech_config():
+    import azure.cognitiveservices.speech as speechsdk
+    return speechsdk.SpeechConfig(subscription=_lookup("SPEECH_KEY"), region=_lookup("SPEECH_REGION"))
+
+
+def _build_search_client():
+    from azure.search.documents import SearchClient
+    from azure.core.credentials import AzureKeyCredential
+    return SearchClient(endpoint=_lookup("SEARCH_ENDPOINT"), index_name=SEARCH_INDEX, credential=AzureKeyCredential(_lookup("SEARCH_KEY")))
+
+
+def _build_async_search_client():
+    from azure.search.documents.aio import SearchClient
+    from azure.core.credentials import AzureKeyCredential
+    return SearchClient(endpoint=_lookup("SEARCH_ENDPOINT"), index_name=SEARCH_INDEX, credential=AzureKeyCredential(_lookup("SEARCH_KEY")))
+
 
-try:
-    # OpenAI Chat + Embeddings
-    OAI_ENDPOINT = get_secret("oai-internship-eus2-endpoint")
-    CHAT_OAI_CLIENT = get_secret("gpt-4o-deployment-endpoint") + "/chat/completions?api-version=2025-01-01-preview"
-    EMBEDDED_OAI_CLIENT = get_secret("text-embedding-3-large-deployment-endpoint") + "/embeddings?api-version=2023-05-15"
-    print("CHAT_OAI_CLIENT : ", CHAT_OAI_CLIENT)
-    print("EMBEDDED_OAI_CLIENT : ", EMBEDDED_OAI_CLIENT)
-    OAI_KEY = get_secret("oai-internship-eus2-key1")
+def _build_search_index_client():
+    from azure.search.documents.indexes import SearchIndexClient
+    from azure.core.credentials import AzureKeyCredential
+    return SearchIndexClient(endpoint=_lookup("SEARCH_ENDPOINT"), credential=AzureKeyCredential(_lookup("SEARCH_KEY")))
 
-    chat_client = AzureOpenAI(base_url=CHAT_OAI_CLIENT, api_key=OAI_KEY, api_version="2024-12-01-preview")
-    embedding_client = AzureOpenAI(base_url=EMBEDDED_OAI_CLIENT, api_key=OAI_KEY, api_version="2023-05-15")
 
-    # Document Intelligence
-    DI_ENDPOINT = get_secret("text-embedding-3-large-deployment-endpoint")
-    DI_KEY = get_secret("di-internship-eus2-key1")
-    di_client = DocumentIntelligenceClient(endpoint=DI_ENDPOINT, credential=AzureKeyCredential(DI_KEY))
+# Values resolved through module __getattr__ on first access
+_LAZY_VALUES = {
+    "CHAT_OAI_CLIENT": _chat_deployment_url,
+    "EMBEDDED_OAI_CLIENT": _embedding_deployment_url,
+    "SPEECH_REGION": lambda: get_region_from_endpoint(_lookup("SPEECH_ENDPOINT")),
+    "speech_config": lambda: _timed("speech_config", _build_speech_config),
+}
+_build_lock = threading.RLock()
 
-    # Blob Storage
-    BLOB_CONN = get_secret("sainternshipeus-connection-string")
-    blob_service_client = BlobServiceClient.from_connection_string(BLOB_CONN)
 
-    # Speech
-    SPEECH_ENDPOINT = get_secret("sps-internship-eus2-endpoint")
-    SPEECH_KEY = get_secret("sps-internship-eus2-key1")
-    SPEECH_REGION = get_region_from_endpoint(SPEECH_ENDPOINT)
-    speech_config = speechsdk.SpeechConfig(subscription=SPEECH_KEY, region=SPEECH_REGION)
+def _lookup(name):
+    """Value of a secret or lazily built setting, resolved once and then kept as a module global."""
+    value = globals().get(name)
+    if value is not None:
+        return value
+    if name in SECRETS:
+        value = get_secret(SECRETS[name])
+    elif name in _LAZY_VALUES:
+        with _build_lock:
+            if globals().get(name) is None:
+                globals()[name] = _LAZY_VALUES[name]()
+            return globals()[name]
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
 
-    # Search
-    SEARCH_ENDPOINT = get_secret("ss-internship-eus2-endpoint")
-    SEARCH_KEY = get_secret("ss-internship-eus2-key1")
-    SEARCH_INDEX = "chatbot-docs-20250913_145142"
-    search_client = SearchClient(endpoint=SEARCH_ENDPOINT, index_name=SEARCH_INDEX, credential=AzureKeyCredential(SEARCH_KEY))
-    search_index_client = SearchIndexClient(endpoint=SEARCH_ENDPOINT, credential=AzureKeyCredential(SEARCH_KEY))
 
-    # Cosmos DB
-    COSMOS_URI = get_secret("cosmosdb-internship-wus2-uri")
-    COSMOS_KEY = get_secret("cosmosdb-internship-wus2-primary-key")
+def __getattr__(name):
+    # Secrets and derived values: `from config import COSMOS_URI` resolves when the
+    # importing module loads, `config.COSMOS_URI` on first use
+    return _lookup(name)
 
-    # Realtime API
-    REALTIME_ENDPOINT = get_secret("gpt-realtime-endpoint")
-    REALTIME_KEY = get_secret("oai-internship-eus2-key1")
 
-    print("All Azure clients initialized successfully using Key Vault secrets")
+class LazyClient:
+    """Placeholder for a client that is built on the first attribute access."""
 
-except Exception as e:
-    print(f" Failed to initialize clients: {e}")
-    raise
+    def __init__(self, name, factory):
+        self._name = name
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    def resolve(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = _timed(self._name, self._factory)
+        return self._client
+
+    def __getattr__(self, attr):
+        return getattr(self.resolve(), attr)
+
+    def __repr__(self):
+        state = "built" if self._client is not None else "not built"
+        return f"<LazyClient {self._name} ({state})>"
+
+
+chat_client = LazyClient("chat_client", _build_chat_client)
+embedding_client = LazyClient("embedding_client", _build_embedding_client)
+di_client = LazyClient("di_client", _build_di_client)
+blob_service_client = LazyClient("blob_service_client", _build_blob_service_client)
+search_client = LazyClient("search_client", _build_search_client)
+search_index_client = LazyClient("search_index_client", _build_search_index_client)
+
+# Async clients for the async Function handler. They are created once per worker
+# and used from its event loop (the Functions host runs one loop per worker).
+async_chat_client = LazyClient("async_chat_client", _build_async_chat_client)
+async_embedding_client = LazyClient("async_embedding_client", _build_async_embedding_client)
+async_search_client = LazyClient("async_search_client", _build_async_search_client)
+
+
+def format_startup_timings():
+    """Cold-start breakdown, e.g. "config_import=4ms, secrets=310ms (15 fetched), chat_client=330ms".
+
+    A client's time includes the secret fetch it triggered, if it was the first.
+    """
+    parts = []
+    for stage, value in STARTUP_TIMINGS.items():
+        if stage == "secrets_fetched":
+            continue
+        text = f"{stage}={value * 1000:.0f}ms"
+        if stage == "secrets":
+            text += f" ({STARTUP_TIMINGS.get('secrets_fetched', 0)} fetched)"
+        parts.append(text)
+    return ", ".join(parts)
 
 
 # -----------------------------
@@ -108,8 +463,8 @@ def build_realtime_ws_url(endpoint: str | None = None,
     - If the provided endpoint already points to the realtime path, we preserve it.
     - Otherwise we append "/openai/realtime" and add deployment/api-version when provided.
     """
-    endpoint = (endpoint or REALTIME_ENDPOINT or "").strip()
-    api_key = api_key or REALTIME_KEY
+    endpoint = (endpoint or _lookup("REALTIME_ENDPOINT") or "").strip()
+    api_key = api_key or _lookup("REALTIME_KEY")
     if not endpoint:
         raise ValueError("Realtime endpoint is not configured")
     if not api_key:
@@ -145,10 +500,12 @@ def GetRealTimeClient(api_key: str | None = None,
     WS URL so the client can connect directly without exposing keys in code.
     """
     ws_url = build_realtime_ws_url(
-        endpoint=endpoint or REALTIME_ENDPOINT,
-        api_key=api_key or REALTIME_KEY,
+        endpoint=endpoint or _lookup("REALTIME_ENDPOINT"),
+        api_key=api_key or _lookup("REALTIME_KEY"),
         deployment=deployment_name,
         api_version=api_version
     )
     return {"ws_url": ws_url}
 
+
+STARTUP_TIMINGS["config_import"] = time.perf_counter() - _import_started
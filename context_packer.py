@@ -0,0 +1,123 @@
+from token_counter import count_tokens, get_encoding, message_tokens
+
+# -----------------------------
+# Token-budgeted prompt packing
+# -----------------------------
+DOC_SHARE = 0.5        # share of the free budget reserved for retrieved documents
+SUMMARY_SHARE = 0.15   # share reserved for the conversation summary
+CONTEXT_HEADER = "Context from documents:\n"
+SUMMARY_PREFIX = "Summary of earlier conversation:"
+
+
+def doc_text(doc):
+    """A retrieved document's text, whether it is a search result dict or plain text."""
+    return doc["content"] if isinstance(doc, dict) else doc
+
+
+def _truncate_to_tokens(text, max_tokens):
+    encoding = get_encoding()
+    return encoding.decode(encoding.encode(text)[:max_tokens])
+
+
+def _chunks(text):
+    """Split a document into paragraph chunks for partial packing."""
+    return [part for part in text.split("\n\n") if part.strip()]
+
+
+def pack_documents(docs, budget):
+    """Pack documents best-first into `budget` tokens.
+
+    Whole documents are preferred. When the next document does not fit, its
+    paragraphs are added in order while they fit, and a final paragraph is cut
+    at a token boundary so no budget is wasted. Returns (texts, tokens_used).
+    """
+    if docs and isinstance(docs[0], dict) and "score" in docs[0]:
+        docs = sorted(docs, key=lambda d: d["score"], reverse=True)
+
+    packed, used = [], 0
+    separator = count_tokens("\n\n")
+    for doc in docs:
+        text = doc_text(doc)
+        cost = count_tokens(text) + (separator if packed else 0)
+        if used + cost <= budget:
+            packed.append(text)
+            used += cost
+            continue
+
+        # The whole document does not fit: take as many leading paragraphs as possible
+        parts = []
+        for chunk in _chunks(text):
+            cost = count_tokens(chunk) + (separator if packed or parts else 0)
+            if used + cost <= budget:
+                parts.append(chunk)
+                used += cost
+                continue
+            remaining = budget - used - (separator if packed or parts else 0)
+            if remaining > 0:
+                parts.append(_truncate_to_tokens(chunk, remaining))
+                used = budget
+            break
+        if parts:
+            packed.append("\n\n".join(parts))
+        if used >= budget:
+            break
+    return packed, used
+
+
+def _split_summary(history):
+    summary, rest = [], list(history)
+    while rest and rest[0]["role"] == "system" and rest[0]["content"].startswith(SUMMARY_PREFIX):
+        summary.append(rest.pop(0))
+    return summary, rest
+
+
+def pack_prompt(system_prompt, docs, history, user_input, budget, doc_share=DOC_SHARE, summary_share=SUMMARY_SHARE):
+    """Build the chat messages for one turn within a token budget.
+
+    The system prompt and user input are always included. Of the remaining
+    budget, retrieved documents get up to doc_share (packed by score) and the
+    conversation summary up to summary_share; recent history fills what is
+    left, newest first. Budget history does not use goes back to documents
+    that were cut.
+    """
+    system_message = {"role": "system", "content": system_prompt}
+    user_message = {"role": "user", "content": user_input}
+    header_tokens = message_tokens({"role": "system", "content": CONTEXT_HEADER})
+    available = budget - message_tokens(system_message) - message_tokens(user_message) - header_tokens
+    free = available
+
+    doc_texts, doc_tokens = pack_documents(docs, max(0, int(available * doc_share)))
+    free -= doc_tokens
+
+    summary_messages, recent = _split_summary(history)
+    packed_summary = []
+    summary_budget = min(free, int(available * summary_share))
+    for message in summary_messages:
+        cost = message_tokens(message)
+        if cost > summary_budget:
+            content = _truncate_to_tokens(message["content"], max(0, summary_budget - count_tokens(message["role"])))
+            message = {"role": message["role"], "content": content}
+            cost = message_tokens(message)
+        if cost <= 0 or cost > summary_budget:
+            break
+        packed_summary.append(message)
+        summary_budget -= cost
+        free -= cost
+
+    packed_history = []
+    for message in reversed(recent):
+        cost = message_tokens(message)
+        if cost > free:
+            break
+        packed_history.append(message)
+        free -= cost
+    packed_history.reverse()
+
+    # Leftover budget goes back to documents that were cut
+    if free > 0 and doc_tokens < sum(count_tokens(doc_text(doc)) for doc in docs):
+        doc_texts, _ = pack_documents(docs, doc_tokens + free)
+
+    messages = [system_message]
+    if doc_texts:
+        messages.append({"role": "system", "content": CONTEXT_HEADER + "\n\n".join(doc_texts)})
+    return messages + packed_summary + packed_history + [user_message]
@@ -0,0 +1,405 @@
+from azure.cosmos import CosmosClient, PartitionKey
+from azure.cosmos.exceptions import (CosmosBatchOperationError, CosmosHttpResponseError, CosmosResourceExistsError,
+                                     CosmosResourceNotFoundError)
+from concurrent.futures import ThreadPoolExecutor
+from config import COSMOS_URI, COSMOS_KEY, SESSION_SOFT_DELETE
+from token_counter import message_tokens
+import time
+import uuid
+
+# -----------------------------
+# Cosmos DB session store
+# -----------------------------
+DATABASE_NAME = "ChatbotDB"
+CONTAINER_NAME = "Sessions"
+
+# Initialize Cosmos DB client and container
+cosmos_client = CosmosClient(COSMOS_URI, COSMOS_KEY)
+database = cosmos_client.create_database_if_not_exists(DATABASE_NAME)
+container = database.create_container_if_not_exists(
+    id=CONTAINER_NAME,
+    partition_key=PartitionKey(path="/sessionId")
+)
+
+
+MESSAGE_FIELDS = "c.role, c.content, c.tokens, c._ts, c.ts"
+TITLE_LENGTH = 20
+SESSIONS_PAGE_SIZE = 50
+HISTORY_PAGE_SIZE = 50
+DELETE_BATCH_SIZE = 100  # transactional batch limit
+DELETE_CONCURRENCY = 4
+
+
+def _meta_id(session_id):
+    return f"session-{session_id}"
+
+
+def _title(content):
+    return content[:TITLE_LENGTH] + '...'
+
+
+# -----------------------------
+# Session metadata
+# -----------------------------
+# One "session" document per partition holds the title, timestamps, message
+# count and summary checkpoint, so listing sessions reads one small document
+# per session instead of scanning messages.
+def _update_meta(session_id, operations, defaults):
+    """Patch the session document, creating it with `defaults` the first time."""
+    try:
+        return container.patch_item(_meta_id(session_id), partition_key=session_id, patch_operations=operations)
+    except CosmosResourceNotFoundError:
+        pass
+    try:
+        return container.create_item(dict({
+            "id": _meta_id(session_id),
+            "sessionId": session_id,
+            "type": "session",
+            "title": None,
+            "createdAt": time.time(),
+            "updatedAt": time.time(),
+            "messageCount": 0
+        }, **defaults))
+    except CosmosResourceExistsError:
+        # Another writer created it first
+        return container.patch_item(_meta_id(session_id), partition_key=session_id, patch_operations=operations)
+
+
+def _touch_session(session_id, role, content, now):
+    meta = _update_meta(
+        session_id,
+        [{"op": "incr", "path": "/messageCount", "value": 1}, {"op": "set", "path": "/updatedAt", "value": now}],
+        {"title": _title(content) if role == "user" else None, "updatedAt": now, "messageCount": 1}
+    )
+    if role == "user" and meta.get("title") is None:
+        container.patch_item(_meta_id(session_id), partition_key=session_id,
+                             patch_operations=[{"op": "set", "path": "/title", "value": _title(content)}])
+
+
+def _message_item(session_id, role, content, ts, item_id=None):
+    return {
+        "id": item_id or str(uuid.uuid4()),
+        "sessionId": session_id,
+        "role": role,
+        "content": content,
+        "tokens": message_tokens({"role": role, "content": content}),
+        "ts": ts  # orders messages written within the same second (_ts has 1s resolution)
+    }
+
+
+def save_message(session_id, role, content):
+    now = time.time()
+    container.create_item(_message_item(session_id, role, content, now))
+    _touch_session(session_id, role, content, now)
+
+
+def save_turn(session_id, user_content, assistant_content, turn_id=None):
+    """Write both messages of a turn and the session-metadata update in one transactional batch.
+
+    The message ids derive from turn_id, so retrying a turn whose write
+    succeeded but reported an error does not store it twice.
+    """
+    now = time.time()
+    turn_id = turn_id or str(uuid.uuid4())
+    messages = [
+        ("create", (_message_item(session_id, "user", user_content, now, f"{turn_id}-user"),)),
+        ("create", (_message_item(session_id, "assistant", assistant_content, now + 1e-6, f"{turn_id}-assistant"),))
+    ]
+    touch = ("patch", (_meta_id(session_id), [
+        {"op": "incr", "path": "/messageCount", "value": 2},
+        {"op": "set", "path": "/updatedAt", "value": now}
+    ]))
+    create_meta = ("create", ({
+        "id": _meta_id(session_id),
+        "sessionId": session_id,
+        "type": "session",
+        "title": _title(user_content),
+        "createdAt": now,
+        "updatedAt": now,
+        "messageCount": 2
+    },))
+
+    # A batch is all-or-nothing. On the first turn of a session the patch fails
+    # with 404 and the batch is resent creating the metadata instead; if another
+    # writer created it meanwhile that fails with 409 and the patch is resent.
+    for batch in ([*messages, touch], [*messages, create_meta], [*messages, touch]):
+        try:
+            results = container.execute_item_batch(batch_operations=batch, partition_key=session_id)
+        except CosmosBatchOperationError as e:
+            status = e.operation_responses[e.error_index].get("statusCode")
+            if e.error_index < len(messages) and status == 409:
+                return  # an earlier attempt of this turn was written
+            if e.error_index != len(messages) or status not in (404, 409):
+                raise
+            continue
+        # A soft clear resets the title; the first turn after it names the session again
+        meta = results[len(messages)].get("resourceBody") or {}
+        if batch[-1] is touch and "title" in meta and meta["title"] is None:
+            container.patch_item(_meta_id(session_id), partition_key=session_id,
+                                 patch_operations=[{"op": "set", "path": "/title", "value": _title(user_content)}])
+        return
+    raise RuntimeError(f"Could not write turn for session {session_id}")
+
+
+def load_session_meta(session_id):
+    try:
+        return container.read_item(_meta_id(session_id), partition_key=session_id)
+    except CosmosResourceNotFoundError:
+        return None
+
+
+def load_session_state(session_id):
+    """Change marker (the metadata ETag and clear generation), message count and summary checkpoint in one point read."""
+    meta = load_session_meta(session_id)
+    if meta is None:
+        return None
+    summary = {"summary": meta["summary"], "covered": meta["covered"]} if meta.get("summary") else None
+    generation = meta.get("generation", 0)
+    return {"version": (meta["_etag"], generation), "generation": generation, "count": meta["messageCount"],
+            "summary": summary}
+
+
+def _query_session(session_id, query, **parameters):
+    """Parameterized query scoped to the session's partition."""
+    return container.query_items(
+        query,
+        parameters=[{"name": "@sessionId", "value": session_id}] +
+                   [{"name": f"@{name}", "value": value} for name, value in parameters.items()],
+        partition_key=session_id
+    )
+
+
+# Chat messages are the only documents without a "type" (session documents
+# have one). A soft-cleared session hides messages written before its
+# clearedAt time until the background purge deletes them.
+VISIBLE_MESSAGES = ("c.sessionId = @sessionId AND NOT IS_DEFINED(c.type) "
+                    "AND (IS_DEFINED(c.ts) ? c.ts : c._ts) > @clearedAt")
+
+
+def _cleared_at(session_id):
+    meta = load_session_meta(session_id)
+    return meta.get("clearedAt", 0) if meta is not None else 0
+
+
+def _message(item):
+    return {"role": item["role"], "content": item["content"], "tokens": item.get("tokens")}
+
+
+def _order_key(item):
+    return item["_ts"], item.get("ts", 0)
+
+
+def iter_messages(session_id):
+    """Lazily yield the full history, oldest first, one result page at a time."""
+    query = f"SELECT {MESSAGE_FIELDS} FROM c WHERE {VISIBLE_MESSAGES} ORDER BY c._ts ASC"
+    page = []
+    for item in _query_session(session_id, query, clearedAt=_cleared_at(session_id)):
+        if page and item["_ts"] != page[-1]["_ts"]:
+            yield from (_message(i) for i in sorted(page, key=_order_key))
+            page = []
+        page.append(item)
+    yield from (_message(i) for i in sorted(page, key=_order_key))
+
+
+def _read_newest(session_id, n, before=None):
+    """The newest `n` visible messages (before the `_ts` second `before`, if given) as items, oldest first.
+
+    _ts has 1s resolution, so TOP can cut through the messages of one second
+    (both halves of a turn share it) in any order: the whole oldest second is
+    read, so the result can hold a few more than `n` items.
+    """
+    cleared_at = _cleared_at(session_id)
+    parameters = {"n": n, "clearedAt": cleared_at}
+    older = ""
+    if before is not None:
+        older = " AND c._ts < @before"
+        parameters["before"] = before
+    query = f"SELECT TOP @n {MESSAGE_FIELDS} FROM c WHERE {VISIBLE_MESSAGES}{older} ORDER BY c._ts DESC"
+    items = list(_query_session(session_id, query, **parameters))
+    if items and len(items) == n:
+        boundary = min(item["_ts"] for item in items)
+        query = f"SELECT {MESSAGE_FIELDS} FROM c WHERE {VISIBLE_MESSAGES} AND c._ts = @boundary"
+        items = ([item for item in items if item["_ts"] > boundary] +
+                 list(_query_session(session_id, query, boundary=boundary, clearedAt=cleared_at)))
+    return sorted(items, key=_order_key)
+
+
+def load_messages(session_id, last_n=None):
+    """The full history, or only the last `last_n` messages read newest-first with TOP."""
+    if last_n is None:
+        return list(iter_messages(session_id))
+    if last_n <= 0:
+        return []
+    return [_message(item) for item in _read_newest(session_id, last_n)[-last_n:]]
+
+
+def load_history_page(session_id, page_size=HISTORY_PAGE_SIZE, cursor=None):
+    """One page of history, newest page first; returns (messages oldest-first, cursor for the previous page or None).
+
+    The cursor is the _ts second the page starts at. A page never splits a
+    second, so a turn's two messages stay on one page and in order.
+    """
+    if page_size <= 0:
+        return [], None
+    items = _read_newest(session_id, page_size, int(cursor) if cursor else None)
+    next_cursor = str(items[0]["_ts"]) if len(items) >= page_size else None
+    return [_message(item) for item in items], next_cursor
+
+
+def count_messages(session_id):
+    meta = load_session_meta(session_id)
+    if meta is not None:
+        return meta["messageCount"]
+    # Session written before metadata documents existed
+    query = "SELECT VALUE COUNT(1) FROM c WHERE c.sessionId = @sessionId AND NOT IS_DEFINED(c.type)"
+    return next(iter(_query_session(session_id, query)), 0)
+
+
+# -----------------------------
+# Clearing sessions
+# -----------------------------
+_purge_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="session-purge")
+
+
+def _delete_batch(session_id, ids):
+    try:
+        container.execute_item_batch(batch_operations=[("delete", (item_id,)) for item_id in ids], partition_key=session_id)
+    except CosmosBatchOperationError:
+        # Something in the batch was already gone; delete the rest one by one
+        for item_id in ids:
+            try:
+                container.delete_item(item_id, partition_key=session_id)
+            except CosmosResourceNotFoundError:
+                pass
+
+
+def _delete_items(session_id, query, **parameters):
+    """Delete matching documents in transactional batches, a few batches at a time."""
+    ids = [item["id"] for item in _query_session(session_id, query, **parameters)]
+    chunks = [ids[i:i + DELETE_BATCH_SIZE] for i in range(0, len(ids), DELETE_BATCH_SIZE)]
+    with ThreadPoolExecutor(max_workers=DELETE_CONCURRENCY) as executor:
+        list(executor.map(lambda chunk: _delete_batch(session_id, chunk), chunks))
+    return len(ids)
+
+
+def _purge_cleared(session_id, cleared_at):
+    """Background garbage collection for a soft clear: delete what it hid."""
+    try:
+        query = ("SELECT c.id FROM c WHERE c.sessionId = @sessionId AND ((NOT IS_DEFINED(c.type) "
+                 "AND (IS_DEFINED(c.ts) ? c.ts : c._ts) <= @clearedAt) OR c.type = 'summary')")
+        deleted = _delete_items(session_id, query, clearedAt=cleared_at)
+        print(f"Purged {deleted} cleared documents from session {session_id}")
+    except Exception as e:
+        print(f"Failed to purge cleared session {session_id}: {e}")
+
+
+def _hard_clear(session_id):
+    try:
+        # One call; the service deletes the partition's documents in the background
+        container.delete_all_items_by_partition_key(session_id)
+        return
+    except (AttributeError, CosmosHttpResponseError) as e:
+        # Older SDK, or the partition-key delete feature is not enabled on the account
+        print(f"Partition-key delete unavailable ({e}), deleting in batches")
+    _delete_items(session_id, "SELECT c.id FROM c WHERE c.sessionId = @sessionId")
+
+
+def clear_conversation(session_id, soft=SESSION_SOFT_DELETE):
+    """Delete a session's messages.
+
+    Soft: one patch of the session document bumps its generation and hides
+    everything written before now; the documents are purged in the background.
+    Hard, or when the session has no metadata document: partition-key delete,
+    falling back to transactional batches of deletes.
+    """
+    if soft:
+        now = time.time()
+        try:
+            container.patch_item(_meta_id(session_id), partition_key=session_id, patch_operations=[
+                {"op": "incr", "path": "/generation", "value": 1},
+                {"op": "set", "path": "/clearedAt", "value": now},
+                {"op": "set", "path": "/messageCount", "value": 0},
+                {"op": "set", "path": "/title", "value": None},
+                {"op": "set", "path": "/summary", "value": None},
+                {"op": "set", "path": "/covered", "value": 0},
+                {"op": "set", "path": "/updatedAt", "value": now}
+            ])
+        except CosmosResourceNotFoundError:
+            pass
+        else:
+            _purge_executor.submit(_purge_cleared, session_id, now)
+            return
+    _hard_clear(session_id)
+
+
+def list_sessions(page_size=SESSIONS_PAGE_SIZE, continuation=None):
+    """One page of sessions, most recently active first; returns (sessions, continuation token or None)."""
+    query = "SELECT c.sessionId, c.title, c.updatedAt, c.messageCount FROM c WHERE c.type = 'session' AND c.messageCount > 0 ORDER BY c.updatedAt DESC"
+    pages = container.query_items(query, enable_cross_partition_query=True, max_item_count=page_size).by_page(continuation)
+    items = list(next(pages, []))
+    sessions = [{"id": item["sessionId"], "title": item.get("title") or 'Untitled',
+                 "updatedAt": item["updatedAt"], "messageCount": item["messageCount"]} for item in items]
+    return sessions, pages.continuation_token
+
+
+def backfill_session_meta():
+    """Create session documents for sessions written before they existed (one-off migration)."""
+    session_ids = {item["sessionId"] for item in container.query_items(
+        "SELECT DISTINCT c.sessionId FROM c", enable_cross_partition_query=True)}
+    for session_id in session_ids:
+        if load_session_meta(session_id) is not None:
+            continue
+        messages = list(_query_session(
+            session_id,
+            "SELECT c.role, c.content, c._ts FROM c WHERE c.sessionId = @sessionId AND NOT IS_DEFINED(c.type) ORDER BY c._ts ASC"
+        ))
+        if not messages:
+            continue
+        first_user = next((m for m in messages if m["role"] == "user"), None)
+        meta = {
+            "id": _meta_id(session_id),
+            "sessionId": session_id,
+            "type": "session",
+            "title": _title(first_user["content"]) if first_user else None,
+            "createdAt": messages[0]["_ts"],
+            "updatedAt": messages[-1]["_ts"],
+            "messageCount": len(messages)
+        }
+        legacy = _read_legacy_summary(session_id)
+        if legacy:
+            meta.update(legacy)
+        container.upsert_item(meta)
+        print(f"Backfilled session metadata for {session_id} ({len(messages)} messages)")
+
+
+# -----------------------------
+# Summary checkpoints
+# -----------------------------
+def _read_legacy_summary(session_id):
+    try:
+        item = container.read_item(f"summary-{session_id}", partition_key=session_id)
+    except CosmosResourceNotFoundError:
+        return None
+    return {"summary": item["summary"], "covered": item["covered"]}
+
+
+def load_summary(session_id):
+    """Return {"summary", "covered"} for the session, or None if it has no checkpoint yet."""
+    meta = load_session_meta(session_id)
+    if meta is not None and "summary" in meta:
+        return {"summary": meta["summary"], "covered": meta["covered"]} if meta["summary"] else None
+    # Checkpoints written before they moved into the session document
+    return _read_legacy_summary(session_id)
+
+
+def save_summary(session_id, summary, covered):
+    """Store the rolling summary and the number of leading messages it covers."""
+    _update_meta(
+        session_id,
+        [{"op": "set", "path": "/summary", "value": summary}, {"op": "set", "path": "/covered", "value": covered}],
+        {"summary": summary, "covered": covered}
+    )
+
+
+if __name__ == "__main__":
+    backfill_session_meta()
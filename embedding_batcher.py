@@ -0,0 +1,81 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class EmbeddingBatcher:
+    """Coalesce concurrent embedding requests into multi-input API calls.
+
+    Callers block in embed() while a single worker thread gathers every
+    query that arrives within max_wait_ms of the first one (or until
+    max_batch_size is reached), sends them as one request through
+    create_fn, and hands each caller its own vector.
+
+    create_fn takes a list of strings and returns a list of vectors in the
+    same order.
+    """
+
+    def __init__(self, create_fn, max_batch_size=16, max_wait_ms=5):
+        self.create_fn = create_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue = queue.Queue()
+        self._worker = None
+        self._start_lock = threading.Lock()
+
+        self.batches = 0
+        self.items = 0
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._start_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._worker.start()
+
+    def embed(self, text, timeout=None):
+        """Return the embedding for one text, batched with concurrent callers."""
+        future = Future()
+        self._ensure_worker()
+        self._queue.put((text, future))
+        return future.result(timeout=timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # Identical queries in the same window share one input slot
+            inputs = list(dict.fromkeys(text for text, _ in batch))
+            try:
+                vectors = self.create_fn(inputs)
+                by_text = dict(zip(inputs, vectors))
+                for text, future in batch:
+                    future.set_result(by_text[text])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            self.batches += 1
+            self.items += len(batch)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+        }
@@ -0,0 +1,255 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory file locks, so each process keeps its own disk file
+    fcntl = None
+
+# -----------------------------
+# Query normalization
+# -----------------------------
+_WHITESPACE_RE = re.compile(r"\s+")
+_TRAILING_PUNCT_RE = re.compile(r"[\s?!.,;:]+$")
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a query so trivial variants share one cache key.
+
+    "What is RAG?" and "  what is  rag " both become "what is rag".
+    """
+    key = _WHITESPACE_RE.sub(" ", query.strip().lower())
+    return _TRAILING_PUNCT_RE.sub("", key)
+
+
+def _key_hash(key):
+    # Stable across processes, unlike hash()
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+# -----------------------------
+# Embedding cache
+# -----------------------------
+class EmbeddingCache:
+    """Bounded LRU cache of query embeddings with an optional disk tier.
+
+    Vectors are stored as float32. The in-memory tier is bounded by its
+    approximate footprint in bytes and evicts least recently used entries.
+    The disk tier is a fixed-size memory-mapped file of vector rows, a small
+    file of (key hash, time) per row and a JSON key index, so a fresh worker
+    can warm itself from the previous one's work. Workers on one machine
+    share the files: rows are claimed in turn from a ring cursor in the small
+    file's header, under a file lock, so the oldest row is overwritten and a
+    put only touches the row it writes. A row is only used when its key hash
+    and time match the index entry, so a row another worker has since reused
+    reads as a miss.
+    """
+
+    def __init__(self, dim=3072, max_bytes=64 * 1024 * 1024, ttl_seconds=None,
+                 disk_dir=None, disk_capacity=20000, index_flush_every=20):
+        self.dim = dim
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds or None
+        self.disk_dir = disk_dir or None
+        self.disk_capacity = disk_capacity
+        self.index_flush_every = index_flush_every
+
+        self._entries = OrderedDict()  # key -> (vector, created_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._rows = None  # (hash, created) per row; the vectors are in self._vectors
+        self._vectors = None
+        self._cursor = None  # next row to claim, shared by the workers
+        self._disk_index = {}  # key -> [row, created_at]
+        self._row_keys = {}  # row -> key, so ring overwrites drop the old key
+        self._dirty = 0
+        if self.disk_dir:
+            try:
+                self._open_disk_tier()
+            except Exception as e:
+                print(f"Embedding disk cache disabled: {e}")
+                self.disk_dir = None
+
+    # --- disk tier ---
+    def _open_disk_tier(self):
+        os.makedirs(self.disk_dir, exist_ok=True)
+        # The layout is in the name, so a worker with other settings never remaps a file in use
+        name = f"embeddings-{self.dim}x{self.disk_capacity}"
+        if fcntl is None:
+            name += f"-{os.getpid()}"
+        rows_path = os.path.join(self.disk_dir, name + ".meta")
+        vectors_path = os.path.join(self.disk_dir, name + ".vectors")
+        self._index_path = os.path.join(self.disk_dir, name + ".json")
+        self._lock_file = open(os.path.join(self.disk_dir, name + ".lock"), "a+")
+
+        row_dtype = np.dtype([("hash", "<u8"), ("created", "<f8")])
+        with self._file_lock():
+            # Created once under the lock and never truncated: other workers may have them mapped
+            mode = "r+" if os.path.exists(rows_path) and os.path.exists(vectors_path) else "w+"
+            self._vectors = np.memmap(vectors_path, dtype="<f4", mode=mode, shape=(self.disk_capacity, self.dim))
+            self._rows = np.memmap(rows_path, dtype=row_dtype, mode=mode, offset=8, shape=(self.disk_capacity,))
+            self._cursor = np.memmap(rows_path, dtype="<u8", mode="r+", shape=(1,))
+            index = self._read_index()
+
+        self._disk_index = {k: v for k, v in index.items()
+                            if self._row_matches(k, *v) and not self._expired(v[1])}
+        self._row_keys = {v[0]: k for k, v in self._disk_index.items()}
+        print(f"Embedding disk cache loaded with {len(self._disk_index)} entries.")
+
+    @contextmanager
+    def _file_lock(self, shared=False):
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(self._lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _read_index(self):
+        try:
+            with open(self._index_path, "r") as f:
+                return {k: v for k, v in json.load(f).get("keys", {}).items() if 0 <= v[0] < self.disk_capacity}
+        except (OSError, ValueError):
+            return {}
+
+    def _row_matches(self, key, row, created_at):
+        record = self._rows[row]
+        return record["created"] == created_at and record["hash"] == _key_hash(key)
+
+    def _read_disk(self, key, row, created_at):
+        with self._file_lock(shared=True):
+            if not self._row_matches(key, row, created_at):
+                return None
+            return np.array(self._vectors[row], dtype=np.float32)
+
+    def _write_disk(self, key, vector, created_at):
+        with self._file_lock():
+            row = int(self._cursor[0] % self.disk_capacity)
+            self._cursor[0] = row + 1
+            self._vectors[row] = vector
+            self._rows[row] = (_key_hash(key), created_at)
+        # Drop whichever key this worker had at the reused row
+        stale = self._row_keys.pop(row, None)
+        if stale is not None and self._disk_index.get(stale, [None])[0] == row:
+            del self._disk_index[stale]
+        self._disk_index[key] = [row, created_at]
+        self._row_keys[row] = key
+        self._dirty += 1
+        if self._dirty >= self.index_flush_every:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if self._rows is None:
+            return
+        self._vectors.flush()
+        self._rows.flush()
+        self._cursor.flush()
+        with self._file_lock():
+            # Merge with the other workers' keys, keeping only rows that still hold them
+            index = self._read_index()
+            index.update(self._disk_index)
+            index = {k: v for k, v in index.items() if self._row_matches(k, *v)}
+            tmp_path = f"{self._index_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"keys": index}, f)
+            os.replace(tmp_path, self._index_path)
+        self._disk_index = index
+        self._row_keys = {v[0]: k for k, v in index.items()}
+        self._dirty = 0
+
+    def flush(self):
+        """Persist the disk tier index and vectors."""
+        with self._lock:
+            if self._dirty:
+                self._flush_locked()
+
+    # --- memory tier ---
+    def _expired(self, created_at):
+        return self.ttl_seconds is not None and time.time() - created_at >= self.ttl_seconds
+
+    def _insert_locked(self, key, vector, created_at):
+        if key in self._entries:
+            old_vector, _ = self._entries.pop(key)
+            self._bytes -= old_vector.nbytes + len(key)
+        self._entries[key] = (vector, created_at)
+        self._bytes += vector.nbytes + len(key)
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            old_key, (old_vector, _) = self._entries.popitem(last=False)
+            self._bytes -= old_vector.nbytes + len(old_key)
+            self.evictions += 1
+
+    def get(self, query):
+        key = normalize_query(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                vector, created_at = entry
+                if not self._expired(created_at):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return vector
+                del self._entries[key]
+                self._bytes -= vector.nbytes + len(key)
+
+            disk_entry = self._disk_index.get(key)
+            if disk_entry is not None:
+                row, created_at = disk_entry
+                vector = None if self._expired(created_at) else self._read_disk(key, row, created_at)
+                if vector is not None:
+                    self._insert_locked(key, vector, created_at)
+                    self.disk_hits += 1
+                    return vector
+                del self._disk_index[key]
+
+            self.misses += 1
+            return None
+
+    def put(self, query, embedding):
+        key = normalize_query(query)
+        vector = np.asarray(embedding, dtype=np.float32)
+        created_at = time.time()
+        with self._lock:
+            self._insert_locked(key, vector, created_at)
+            if self._rows is not None and vector.shape == (self.dim,):
+                self._write_disk(key, vector, created_at)
+        return vector
+
+    def __contains__(self, query):
+        key = normalize_query(query)
+        with self._lock:
+            return key in self._entries or key in self._disk_index
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "disk_entries": len(self._disk_index),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
@@ -1,49 +1,196 @@
-from config import embedding_client, search_client
-from azure.search.documents.models import VectorizedQuery 
-import numpy as np
+from config import (embedding_client, search_client, async_embedding_client, async_search_client, EMBEDDING_DIM, EMBEDDING_CACHE_MAX_MB,
+                    EMBEDDING_CACHE_TTL_SECONDS, EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_DISK_CAPACITY,
+                    EMBEDDING_BATCH_MAX_SIZE, EMBEDDING_BATCH_MAX_WAIT_MS,
+                    RETRIEVAL_BACKEND, LOCAL_INDEX_DIR, LOCAL_INDEX_MODE, LOCAL_INDEX_NPROBE,
+                    SINGLE_FLIGHT_TIMEOUT_SECONDS)
+from embedding_cache import EmbeddingCache, normalize_query
+from single_flight import SingleFlight
+from embedding_batcher import EmbeddingBatcher
+from vector_index import get_local_index
+import atexit
 import time
-from openai import RateLimitError
 
 # Cache for embeddings to reduce API calls
-embedding_cache = {}
+embedding_cache = EmbeddingCache(
+    dim=EMBEDDING_DIM,
+    max_bytes=int(EMBEDDING_CACHE_MAX_MB * 1024 * 1024),
+    ttl_seconds=EMBEDDING_CACHE_TTL_SECONDS,
+    disk_dir=EMBEDDING_CACHE_DIR,
+    disk_capacity=EMBEDDING_CACHE_DISK_CAPACITY
+)
+atexit.register(embedding_cache.flush)
 
-def retrieve_relevant_docs(query, top_k=5):
+# Identical queries in flight at the same time share one embedding call and one search
+embedding_flight = SingleFlight("embedding", SINGLE_FLIGHT_TIMEOUT_SECONDS)
+retrieval_flight = SingleFlight("retrieval", SINGLE_FLIGHT_TIMEOUT_SECONDS)
+
+# Running totals used to estimate what the cache saves
+embedding_calls = 0
+embedding_call_seconds = 0.0
+
+
+def create_embeddings(inputs):
+    """Embed a list of texts in one API call and return the vectors in order.
+
+    Throttling is handled by the rate governor wrapped around embedding_client,
+    which queues and retries 429s before anything reaches this function.
+    """
+    global embedding_calls, embedding_call_seconds
+
+    start = time.perf_counter()
+    response = embedding_client.embeddings.create(
+        input=inputs,
+        model='text-embedding-3-large'
+    )
+    embedding_call_seconds += time.perf_counter() - start
+    embedding_calls += 1
+    return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+
+
+async def acreate_embeddings(inputs):
+    """create_embeddings() on the async client; the rate governor is shared with the sync path."""
+    global embedding_calls, embedding_call_seconds
+
+    start = time.perf_counter()
+    response = await async_embedding_client.embeddings.create(
+        input=inputs,
+        model='text-embedding-3-large'
+    )
+    embedding_call_seconds += time.perf_counter() - start
+    embedding_calls += 1
+    return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+
+
+# Concurrent queries within a short window share one embeddings request
+embedding_batcher = None
+if EMBEDDING_BATCH_MAX_WAIT_MS > 0 and EMBEDDING_BATCH_MAX_SIZE > 1:
+    embedding_batcher = EmbeddingBatcher(
+        create_embeddings,
+        max_batch_size=EMBEDDING_BATCH_MAX_SIZE,
+        max_wait_ms=EMBEDDING_BATCH_MAX_WAIT_MS
+    )
+
+
+def get_query_embedding(query):
+    """Return the float32 embedding for a query, using the cache when possible."""
     # Check cache first to avoid duplicate API calls
-    if query in embedding_cache:
+    query_embedding = embedding_cache.get(query)
+    if query_embedding is not None:
         print("Using cached embedding for query.")
-        query_embedding = embedding_cache[query]
+        return query_embedding
+
+    return embedding_flight.do(normalize_query(query), _embed_query, query)
+
+
+def _embed_query(query):
+    # Generate embedding for the query using Azure OpenAI
+    if embedding_batcher is not None:
+        embedding = embedding_batcher.embed(query)
     else:
-        # Generate embedding for the query using Azure OpenAI
-        max_retries = 1
-        for attempt in range(max_retries):
-            try:
-                response = embedding_client.embeddings.create(
-                    input=[query],
-                    model='text-embedding-3-large'
-                )
-                query_embedding = np.array(response.data[0].embedding)
-                # Cache the embedding for future use
-                embedding_cache[query] = query_embedding
-                print("Embedding generated and cached.")
-                break
-            except RateLimitError:
-                if attempt < max_retries - 1:
-                    wait_time = 2 ** attempt  # Exponential backoff
-                    print(f"Rate limit hit on embedding, retrying in {wait_time} seconds...")
-                    time.sleep(wait_time)
-                else:
-                    raise
+        embedding = create_embeddings([query])[0]
+
+    # Cache the embedding for future use
+    query_embedding = embedding_cache.put(query, embedding)
+    print("Embedding generated and cached.")
+    return query_embedding
+
+
+async def aget_query_embedding(query):
+    """get_query_embedding() for the async handler. The micro-batcher is thread-based, so this
+    path calls the API directly; concurrent coroutines do not hold a thread while they wait."""
+    query_embedding = embedding_cache.get(query)
+    if query_embedding is not None:
+        print("Using cached embedding for query.")
+        return query_embedding
+
+    return await embedding_flight.ado(normalize_query(query), _aembed_query, query)
+
+
+async def _aembed_query(query):
+    embedding = (await acreate_embeddings([query]))[0]
+    query_embedding = embedding_cache.put(query, embedding)
+    print("Embedding generated and cached.")
+    return query_embedding
 
+
+def get_embedding_cache_stats():
+    """Cache hit/miss counters plus the estimated API latency saved by hits."""
+    stats = embedding_cache.stats()
+    avg_call = embedding_call_seconds / embedding_calls if embedding_calls else 0.0
+    stats["embedding_calls"] = embedding_calls
+    stats["avg_call_seconds"] = avg_call
+    stats["estimated_seconds_saved"] = (stats["hits"] + stats["disk_hits"]) * avg_call
+    if embedding_batcher is not None:
+        stats["batching"] = embedding_batcher.stats()
+    stats["coalesced"] = embedding_flight.stats()["coalesced"]
+    return stats
+
+
+def _search_azure(query_embedding, top_k):
     # Search in Azure AI Search
-    vector_query = VectorizedQuery(vector=query_embedding, k_nearest_neighbors=top_k, fields='embedding')
+    from azure.search.documents.models import VectorizedQuery  # only the Azure Search backend needs the SDK
+    vector_query = VectorizedQuery(vector=query_embedding.tolist(), k_nearest_neighbors=top_k, fields='embedding')
     results = search_client.search(
         search_text="",
         vector_queries=[vector_query],
         select=['content']
     )
 
-    docs = []
-    for result in results:
-        docs.append(result['content'])
+    return [_search_doc(result) for result in results]
+
+
+def _search_doc(result):
+    # With the cosine metric Azure AI Search reports 1 / (2 - cosine)
+    score = result.get('@search.score')
+    return {"content": result['content'], "score": 2 - 1 / score if score else 0.0}
+
+
+async def _asearch_azure(query_embedding, top_k):
+    from azure.search.documents.models import VectorizedQuery
+    vector_query = VectorizedQuery(vector=query_embedding.tolist(), k_nearest_neighbors=top_k, fields='embedding')
+    results = await async_search_client.search(
+        search_text="",
+        vector_queries=[vector_query],
+        select=['content']
+    )
+    return [_search_doc(result) async for result in results]
+
+
+def _search_local(query_embedding, top_k):
+    index = get_local_index(LOCAL_INDEX_DIR, mode=LOCAL_INDEX_MODE, nprobe=LOCAL_INDEX_NPROBE)
+    return index.search(query_embedding, top_k=top_k)
+
+
+def search_documents(query, top_k=5):
+    """Return the top_k documents as {"content", "score"} dicts, where score is cosine similarity.
+
+    The returned list may be shared with concurrent callers; do not modify it.
+    """
+    return retrieval_flight.do((normalize_query(query), top_k), _search_documents, query, top_k)
+
+
+def _search_documents(query, top_k):
+    query_embedding = get_query_embedding(query)
+    if RETRIEVAL_BACKEND == "local":
+        return _search_local(query_embedding, top_k)
+    return _search_azure(query_embedding, top_k)
+
+
+def retrieve_relevant_docs(query, top_k=5):
+    return [doc["content"] for doc in search_documents(query, top_k=top_k)]
+
+
+async def asearch_documents(query, top_k=5):
+    """search_documents() for the async handler; the local index is searched in-process."""
+    return await retrieval_flight.ado((normalize_query(query), top_k), _asearch_documents, query, top_k)
+
+
+async def _asearch_documents(query, top_k):
+    query_embedding = await aget_query_embedding(query)
+    if RETRIEVAL_BACKEND == "local":
+        return _search_local(query_embedding, top_k)
+    return await _asearch_azure(query_embedding, top_k)
+
 
-    return docs
+async def aretrieve_relevant_docs(query, top_k=5):
+    return [doc["content"] for doc in await asearch_documents(query, top_k=top_k)]
@@ -1,58 +1,61 @@
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import asyncio
 import json
 import uuid
+import threading
 import azure.functions as func
 import logging
-from config import COSMOS_URI , COSMOS_KEY
-from config import build_realtime_ws_url
-from chat_logic import SUMMARIZE_AFTER, trim_history, summarize_conversation, generate_rag_response
-from embedding_search import retrieve_relevant_docs
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Load Cosmos DB config from environment variables
-COSMOS_URI = COSMOS_URI
-COSMOS_KEY = COSMOS_KEY
-DATABASE_NAME = "ChatbotDB"
-CONTAINER_NAME = "Sessions"
+# Modules are imported by the routes that need them (chat_logic, pipeline and
+# their SDKs only for chat), so a cold start serving index.html or session-id
+# loads almost nothing.
+_session_store = None
+_session_store_lock = threading.Lock()
+_cold_start_logged = False
 
-# In-memory storage for sessions if Cosmos DB is not configured
-sessions = {}
 
+def get_store():
+    """The session store, created by the first request that needs it."""
+    global _session_store
+    if _session_store is None:
+        with _session_store_lock:
+            if _session_store is None:
+                from session_store import get_session_store
+                _session_store = get_session_store()
+    return _session_store
 
-from azure.cosmos import CosmosClient, PartitionKey
-# Initialize Cosmos DB client and container
-cosmos_client = CosmosClient(COSMOS_URI, COSMOS_KEY)
-database = cosmos_client.create_database_if_not_exists(DATABASE_NAME)
-container = database.create_container_if_not_exists(
-    id=CONTAINER_NAME,
-    partition_key=PartitionKey(path="/sessionId")
-)
 
-def save_message(session_id, role, content):
-    container.create_item({
-        "id": str(uuid.uuid4()),
-        "sessionId": session_id,
-        "role": role,
-        "content": content
-    })
+def log_cold_start():
+    """Log the config cold-start breakdown once, after the first chat turn built the clients."""
+    global _cold_start_logged
+    if not _cold_start_logged:
+        _cold_start_logged = True
+        from config import format_startup_timings
+        logger.info(f"Cold start: {format_startup_timings()}")
 
-def load_messages(session_id):
-    query = f"SELECT c.role, c.content FROM c WHERE c.sessionId = '{session_id}' ORDER BY c._ts ASC"
-    items = list(container.query_items(query, enable_cross_partition_query=True))
-    return [{"role": i["role"], "content": i["content"]} for i in items]
 
-def clear_conversation(session_id):
-    query = f"SELECT c.id, c.sessionId FROM c WHERE c.sessionId = '{session_id}'"
-    items = list(container.query_items(query, enable_cross_partition_query=True))
-    for item in items:
-       container.delete_item(item["id"], partition_key=item["sessionId"])
+async def call_store(method, *args):
+    """Run a session-store call on a worker thread; the stores and their SDKs are synchronous."""
+    return await asyncio.to_thread(lambda: getattr(get_store(), method)(*args))
 
 
-def main(req: func.HttpRequest) -> func.HttpResponse:
+async def clear_session(session_id):
+    """Clear a session after its queued write-behind saves (pipeline is loaded only when write-behind is on)."""
+    from config import SESSION_WRITE_BEHIND
+    if not SESSION_WRITE_BEHIND:
+        return await call_store("clear_conversation", session_id)
+    from pipeline import clear_session as clear_after_writes
+    return await asyncio.to_thread(lambda: clear_after_writes(session_id, get_store()))
+
+
+async def main(req: func.HttpRequest) -> func.HttpResponse:
+    # Async handler: while one chat waits on OpenAI or Search, the worker's event
+    # loop serves other requests instead of holding a thread per chat
     try:
         path = req.route_params.get('path', '').strip('/')
         logger.info(f"Request path: {path}")
@@ -69,17 +72,9 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
                 action = req.params.get('action')
                 if action == 'sessions':
                     try:
-                        query = "SELECT DISTINCT c.sessionId FROM c"
-                        items = list(container.query_items(query, enable_cross_partition_query=True, max_item_count=1000))
-                        sessions = []
-                        for item in items:
-                            session_id = item['sessionId']
-                            # Get first message as title
-                            first_msg_query = f"SELECT TOP 1 c.content FROM c WHERE c.sessionId = '{session_id}' AND c.role = 'user' ORDER BY c._ts ASC"
-                            first_msgs = list(container.query_items(first_msg_query, enable_cross_partition_query=True))
-                            title = first_msgs[0]['content'][:20] + '...' if first_msgs else 'Untitled'
-                            sessions.append({"id": session_id, "title": title})
-                        return func.HttpResponse(json.dumps({"sessions": sessions}), mimetype="application/json", headers={
+                        page_size = min(int(req.params.get('page_size', 50)), 200)
+                        sessions, continuation = await call_store("list_sessions", page_size, req.params.get('continuation'))
+                        return func.HttpResponse(json.dumps({"sessions": sessions, "continuation": continuation}), mimetype="application/json", headers={
                             'Access-Control-Allow-Origin': '*',
                             'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
                             'Access-Control-Allow-Headers': 'Content-Type'
@@ -100,9 +95,11 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
                             'Access-Control-Allow-Headers': 'Content-Type'
                         })
                     try:
-                        history = load_messages(session_id)
+                        # Newest page first; pass the returned cursor back to get the page before it
+                        page_size = min(int(req.params.get('page_size', 50)), 200)
+                        history, cursor = await call_store("load_history_page", session_id, page_size, req.params.get('cursor'))
                         history_formatted = [{"text": msg["content"], "isUser": msg["role"] == "user"} for msg in history]
-                        return func.HttpResponse(json.dumps({"history": history_formatted}), mimetype="application/json", headers={
+                        return func.HttpResponse(json.dumps({"history": history_formatted, "cursor": cursor}), mimetype="application/json", headers={
                             'Access-Control-Allow-Origin': '*',
                             'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
                             'Access-Control-Allow-Headers': 'Content-Type'
@@ -146,7 +143,7 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
                     })
                 if cmd == "clear":
                     try:
-                        clear_conversation(session_id)
+                        await clear_session(session_id)
                         return func.HttpResponse(json.dumps({"response": "Conversation cleared"}), mimetype="application/json", headers={
                             'Access-Control-Allow-Origin': '*',
                             'Access-Control-Allow-Methods': 'POST, OPTIONS',
@@ -161,7 +158,7 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
                         })
                 if cmd == "restart":
                     try:
-                        clear_conversation(session_id)
+                        await clear_session(session_id)
                         return func.HttpResponse(json.dumps({"response": "Session restarted"}), mimetype="application/json", headers={
                             'Access-Control-Allow-Origin': '*',
                             'Access-Control-Allow-Methods': 'POST, OPTIONS',
@@ -176,7 +173,7 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
                         })
                 if cmd == "show history":
                     try:
-                        history = load_messages(session_id)
+                        history = await call_store("load_messages", session_id)
                         if not history:
                             resp = "No messages found"
                         else:
@@ -195,30 +192,20 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
                         })
 
                 try:
-                    save_message(session_id, "user", user_input)
-                except Exception as e:
-                    logger.error(f"Error saving user message: {e}")
-                    return func.HttpResponse(json.dumps({"error": "Failed to save message"}), status_code=500, mimetype="application/json", headers={
-                        'Access-Control-Allow-Origin': '*',
-                        'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                        'Access-Control-Allow-Headers': 'Content-Type'
-                    })
-
-                try:
-                    history = load_messages(session_id)
-                    if len(history) > SUMMARIZE_AFTER:
-                        summary_text = summarize_conversation(history[:-10])
-                        history = [{"role": "system", "content": f"Summary of earlier conversation: {summary_text}"}] + history[-10:]
-
-                    history = trim_history(history)
+                    # Retrieval runs alongside history/summary loading; the whole turn is saved once the answer is ready
+                    from chat_logic import agenerate_rag_response
+                    from pipeline import aprepare_turn, afinish_turn
 
-                    relevant_docs = retrieve_relevant_docs(user_input, top_k=3)
+                    turn = await aprepare_turn(session_id, user_input, await asyncio.to_thread(get_store))
 
-                    response = generate_rag_response(user_input, history, relevant_docs)
+                    # One JSON body: the function.json (v1) model cannot flush a response early, so only the CLI streams
+                    response = await agenerate_rag_response(user_input, turn.history, turn.relevant_docs)
 
-                    save_message(session_id, "assistant", response)
+                    await afinish_turn(turn, response)
 
                     logger.info(f"Response generated: {response}")
+                    logger.info(f"Stage timings: {turn.format_timings()}")
+                    log_cold_start()
 
                     return func.HttpResponse(json.dumps({"response": response}), mimetype="application/json", headers={
                         'Access-Control-Allow-Origin': '*',
@@ -238,6 +225,7 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
                 try:
                     deployment = req.params.get('deployment')
                     api_version = req.params.get('api_version')
+                    from config import build_realtime_ws_url
                     ws_url = build_realtime_ws_url(deployment=deployment, api_version=api_version)
                     return func.HttpResponse(json.dumps({"url": ws_url}), mimetype="application/json", headers={
                         'Access-Control-Allow-Origin': '*',
@@ -0,0 +1,124 @@
+import asyncio
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from config import SESSION_WRITE_BEHIND, WRITE_BEHIND_MAX_PENDING
+from chat_logic import trim_history, load_history_window, build_history_with_summary
+from embedding_search import search_documents, asearch_documents
+from write_behind import WriteBehindQueue
+
+# -----------------------------
+# Concurrent chat-turn pipeline
+# -----------------------------
+# Retrieval (embedding + vector search) does not depend on the session at
+# all, so it runs while history and summary are loaded. Both messages of a
+# turn are written together once the answer is ready (one transactional
+# batch in Cosmos DB), optionally on a write-behind queue so the response
+# does not wait for storage at all.
+
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="chat-pipeline")
+write_queue = WriteBehindQueue(max_pending=WRITE_BEHIND_MAX_PENDING) if SESSION_WRITE_BEHIND else None
+
+
+def _timed(timings, stage, fn, *args, **kwargs):
+    start = time.perf_counter()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        timings[stage] = time.perf_counter() - start
+
+
+class ChatTurn:
+    """State of one chat turn between prepare_turn and finish_turn."""
+
+    def __init__(self, session_id, user_input, store, history, relevant_docs, timings, started):
+        self.session_id = session_id
+        self.user_input = user_input
+        self.store = store
+        self.history = history
+        self.relevant_docs = relevant_docs
+        self.timings = timings
+        self.started = started
+
+    def format_timings(self):
+        return ", ".join(f"{stage}={seconds * 1000:.0f}ms" for stage, seconds in self.timings.items())
+
+
+def _load_history(session_id, store, timings, background_summary):
+    if write_queue is not None:
+        # Read our own writes: the previous turn may still be queued
+        _timed(timings, "pending_writes", write_queue.wait_for_session, session_id)
+    history, offset, checkpoint = _timed(timings, "load_history", load_history_window, session_id, store)
+    history = _timed(timings, "summary", build_history_with_summary,
+                     session_id, history, store, background_summary, offset, checkpoint)
+    return trim_history(history)
+
+
+def prepare_turn(session_id, user_input, store, top_k=3, background_summary=False):
+    """Load history and retrieve documents concurrently.
+
+    The returned history does not contain the current user message; the
+    prompt builder appends it. The documents are search results with their
+    content and score, so the prompt is packed best-first.
+    """
+    started = time.perf_counter()
+    timings = {}
+
+    retrieval = _executor.submit(_timed, timings, "retrieval", search_documents, user_input, top_k)
+
+    history = _load_history(session_id, store, timings, background_summary)
+
+    relevant_docs = retrieval.result()
+    timings["prepare"] = time.perf_counter() - started
+    return ChatTurn(session_id, user_input, store, history, relevant_docs, timings, started)
+
+
+async def _atimed(timings, stage, coroutine):
+    start = time.perf_counter()
+    try:
+        return await coroutine
+    finally:
+        timings[stage] = time.perf_counter() - start
+
+
+async def aprepare_turn(session_id, user_input, store, top_k=3, background_summary=False):
+    """prepare_turn() for the async handler.
+
+    Retrieval (embedding + vector search) runs natively on the event loop. The
+    session store is synchronous (cache, write-behind, short point reads), so
+    history loading runs on a worker thread alongside it.
+    """
+    started = time.perf_counter()
+    timings = {}
+    history, relevant_docs = await asyncio.gather(
+        asyncio.to_thread(_load_history, session_id, store, timings, background_summary),
+        _atimed(timings, "retrieval", asearch_documents(user_input, top_k))
+    )
+    timings["prepare"] = time.perf_counter() - started
+    return ChatTurn(session_id, user_input, store, history, relevant_docs, timings, started)
+
+
+def finish_turn(turn, response):
+    """Persist the user and assistant messages in one write; returns stage timings."""
+    turn.timings["generate"] = time.perf_counter() - turn.started - turn.timings["prepare"]
+    # One id per turn, so queue retries of a write that did land are not stored twice
+    turn_id = str(uuid.uuid4())
+    if write_queue is not None:
+        write_queue.submit(turn.session_id, turn.store.save_turn, turn.session_id, turn.user_input, response, turn_id)
+    else:
+        _timed(turn.timings, "save_turn", turn.store.save_turn, turn.session_id, turn.user_input, response, turn_id)
+    turn.timings["total"] = time.perf_counter() - turn.started
+    return turn.timings
+
+
+async def afinish_turn(turn, response):
+    """finish_turn() off the event loop (the store write, or a queue put that may block when full)."""
+    return await asyncio.to_thread(finish_turn, turn, response)
+
+
+def clear_session(session_id, store):
+    """Clear a session once its queued writes have landed, so a write-behind save cannot bring it back."""
+    if write_queue is not None:
+        write_queue.wait_for_session(session_id)
+    store.clear_conversation(session_id)
@@ -0,0 +1,256 @@
+import asyncio
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+from openai import RateLimitError
+
+from token_counter import count_tokens
+
+# -----------------------------
+# Token buckets
+# -----------------------------
+class TokenBucket:
+    """Classic token bucket: `capacity` units, refilled evenly over a minute."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _take(self, amount):
+        """Take `amount` units if they are there; returns 0, or the seconds until they will be."""
+        with self._lock:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return 0.0
+            return (amount - self.tokens) / self.rate
+
+    def acquire(self, amount, max_wait):
+        """Take `amount` units, waiting up to max_wait seconds; returns False on timeout."""
+        amount = min(float(amount), self.capacity)
+        deadline = time.monotonic() + max_wait
+        while True:
+            wait = self._take(amount)
+            if not wait:
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(wait, remaining))
+
+    async def acquire_async(self, amount, max_wait):
+        """acquire() for coroutines: waits without blocking the event loop."""
+        amount = min(float(amount), self.capacity)
+        deadline = time.monotonic() + max_wait
+        while True:
+            wait = self._take(amount)
+            if not wait:
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            await asyncio.sleep(min(wait, remaining))
+
+    def sync(self, remaining):
+        """Never believe we have more capacity than the service says is left."""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.tokens, float(remaining))
+
+
+# -----------------------------
+# Token estimates
+# -----------------------------
+def estimate_chat_tokens(kwargs):
+    """Prompt tokens plus max_tokens, which Azure OpenAI counts against the TPM quota up front."""
+    prompt = sum(count_tokens(m.get("content") or "") + 4 for m in kwargs.get("messages", []))
+    return prompt + (kwargs.get("max_tokens") or 0)
+
+
+def estimate_embedding_tokens(kwargs):
+    inputs = kwargs.get("input", [])
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    return sum(count_tokens(text) for text in inputs)
+
+
+def _header(headers, name):
+    try:
+        value = headers.get(name)
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+# -----------------------------
+# Rate governor
+# -----------------------------
+class RateGovernor:
+    """Client-side limiter for one Azure OpenAI deployment.
+
+    Requests wait for room in the requests-per-minute and tokens-per-minute
+    buckets (up to max_wait seconds) instead of failing. The buckets are kept
+    in step with the x-ratelimit-remaining-* response headers. On a 429 the
+    governor pauses every caller for the retry-after period (or a jittered
+    exponential backoff) and retries up to max_retries times.
+    """
+
+    def __init__(self, name, rpm, tpm, max_wait=30.0, max_retries=4, base_delay=1.0, max_delay=30.0):
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_wait = max_wait
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+        self.throttled = 0
+        self.retries = 0
+        self.queued_seconds = 0.0
+
+    def pause(self, seconds):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def paused_for(self, now=None):
+        """Seconds until callers may send again after a 429 (0 when not paused)."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            return max(0.0, self._paused_until - now)
+
+    def _wait_for_capacity(self, estimated_tokens):
+        start = time.monotonic()
+        with self._lock:
+            paused = self._paused_until - start
+        if paused > 0:
+            time.sleep(paused)
+        if not (self.requests.acquire(1, self.max_wait) and self.tokens.acquire(estimated_tokens, self.max_wait)):
+            print(f"[{self.name}] local rate budget exhausted after {self.max_wait:.0f}s, sending anyway")
+        self.queued_seconds += time.monotonic() - start
+
+    async def _wait_for_capacity_async(self, estimated_tokens):
+        start = time.monotonic()
+        with self._lock:
+            paused = self._paused_until - start
+        if paused > 0:
+            await asyncio.sleep(paused)
+        if not (await self.requests.acquire_async(1, self.max_wait) and
+                await self.tokens.acquire_async(estimated_tokens, self.max_wait)):
+            print(f"[{self.name}] local rate budget exhausted after {self.max_wait:.0f}s, sending anyway")
+        self.queued_seconds += time.monotonic() - start
+
+    def _backoff(self, attempt, headers):
+        retry_after = _header(headers, "retry-after-ms")
+        retry_after = retry_after / 1000 if retry_after is not None else _header(headers, "retry-after")
+        backoff = min(self.max_delay, self.base_delay * 2 ** attempt)
+        delay = backoff * random.uniform(0.5, 1.0)  # jitter spreads out retries from parallel callers
+        return max(delay, retry_after or 0.0)
+
+    def observe(self, headers):
+        remaining_requests = _header(headers, "x-ratelimit-remaining-requests")
+        remaining_tokens = _header(headers, "x-ratelimit-remaining-tokens")
+        if remaining_requests is not None:
+            self.requests.sync(remaining_requests)
+        if remaining_tokens is not None:
+            self.tokens.sync(remaining_tokens)
+
+    def _throttled(self, attempt, error):
+        """Record a 429 and pause every caller; returns the delay before retrying."""
+        self.throttled += 1
+        headers = error.response.headers if error.response is not None else {}
+        delay = self._backoff(attempt, headers)
+        self.pause(delay)  # later callers back off too, even when this one gives up
+        if attempt < self.max_retries:
+            print(f"[{self.name}] rate limited, retrying in {delay:.1f}s")
+            self.retries += 1
+        return delay
+
+    def call(self, resource, estimated_tokens, **kwargs):
+        """Call resource.create(**kwargs) under the limits and return the parsed result."""
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_capacity(estimated_tokens)
+            try:
+                raw = resource.with_raw_response.create(**kwargs)
+            except RateLimitError as e:
+                self._throttled(attempt, e)
+                if attempt == self.max_retries:
+                    raise
+                continue
+            self.observe(raw.headers)
+            return raw.parse()
+
+    async def acall(self, resource, estimated_tokens, **kwargs):
+        """call() for an async client's resource; shares the buckets with synchronous callers."""
+        for attempt in range(self.max_retries + 1):
+            await self._wait_for_capacity_async(estimated_tokens)
+            try:
+                raw = await resource.with_raw_response.create(**kwargs)
+            except RateLimitError as e:
+                self._throttled(attempt, e)
+                if attempt == self.max_retries:
+                    raise
+                continue
+            self.observe(raw.headers)
+            return raw.parse()
+
+    def stats(self):
+        return {
+            "throttled": self.throttled,
+            "retries": self.retries,
+            "queued_seconds": self.queued_seconds,
+        }
+
+
+# -----------------------------
+# Drop-in client wrapper
+# -----------------------------
+class _GovernedResource:
+    def __init__(self, resource, governor, estimate):
+        self._resource = resource
+        self._governor = governor
+        self._estimate = estimate
+
+    def create(self, **kwargs):
+        return self._governor.call(self._resource, self._estimate(kwargs), **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._resource, name)
+
+
+class _AsyncGovernedResource(_GovernedResource):
+    async def create(self, **kwargs):
+        return await self._governor.acall(self._resource, self._estimate(kwargs), **kwargs)
+
+
+class GovernedClient:
+    """Wrap an AzureOpenAI client so chat.completions.create and embeddings.create go through a RateGovernor."""
+
+    resource_class = _GovernedResource
+
+    def __init__(self, client, governor):
+        self._client = client
+        self.governor = governor
+        self.chat = SimpleNamespace(completions=self.resource_class(client.chat.completions, governor, estimate_chat_tokens))
+        self.embeddings = self.resource_class(client.embeddings, governor, estimate_embedding_tokens)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+class AsyncGovernedClient(GovernedClient):
+    """GovernedClient for AsyncAzureOpenAI: `await client.chat.completions.create(...)`."""
+
+    resource_class = _AsyncGovernedResource
@@ -0,0 +1,92 @@
+import re
+from collections import OrderedDict
+from threading import Lock
+
+# -----------------------------
+# Relevance gate
+# -----------------------------
+# A query is related to a document when enough of its content terms appear
+# in the document's term sketch. Sketches are computed once per document
+# text and cached, so a check is a few set lookups.
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Function words, greetings and the phrasing users wrap questions in ("can
+# you tell me about ...", "recommend a course on ...", "compare x vs y"),
+# which say nothing about the topic itself.
+STOPWORDS = frozenset("""
+a about above after again all also am an and any are as at be because been before being below
+between both but by can could did do does doing down during each explain few for from further
+give had has have having he her here hers him his how i if in into is it its itself just know
+learn me more most my no nor not now of off on once only or other our out over own please
+recommend recommendation recommendations course courses same she should show so some such tell
+than that the their them then there these they this those through to too under until up very
+want was we were what when where which while who whom why will with would you your
+hello hi hey thanks thank ok okay yes bye goodbye compare comparison difference versus vs
+""".split())
+
+SKETCH_CACHE_SIZE = 1024
+
+_sketch_cache = OrderedDict()
+_sketch_lock = Lock()
+
+
+def _stem(token):
+    # Light plural folding so "networks" matches "network"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def content_terms(text):
+    """Set of normalized content terms in a text."""
+    return {_stem(t) for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS}
+
+
+def document_sketch(document):
+    """Cached term sketch of a document."""
+    with _sketch_lock:
+        sketch = _sketch_cache.get(document)
+        if sketch is not None:
+            _sketch_cache.move_to_end(document)
+            return sketch
+    sketch = frozenset(_stem(t) for t in set(_TOKEN_RE.findall(document.lower())))
+    with _sketch_lock:
+        _sketch_cache[document] = sketch
+        if len(_sketch_cache) > SKETCH_CACHE_SIZE:
+            _sketch_cache.popitem(last=False)
+    return sketch
+
+
+def is_query_related(query: str, documents: list, min_score: float, threshold: float = 0.25) -> bool:
+    """
+    Check if a question is related to its retrieved documents.
+
+    Search results ({"content", "score"}) pass when the best cosine score
+    reaches `min_score`; plain texts fall back to the term check. A query
+    with no content terms (a greeting, "thanks") is let through so the model
+    can answer it.
+    """
+    if not content_terms(query):
+        return True
+    scores = [doc["score"] for doc in documents if isinstance(doc, dict) and doc.get("score") is not None]
+    if scores:
+        return max(scores) >= min_score
+    return is_topic_related_to_documents(query, documents, threshold)
+
+
+def is_topic_related_to_documents(query_topic: str, documents: list, threshold: float = 0.25) -> bool:
+    """
+    Check if the query topic is related to any retrieved document.
+
+    A query with no content terms (a greeting, "thanks") is let through so the
+    model can answer it; otherwise at least `threshold` of its content terms
+    must appear in one of the documents.
+    """
+    terms = content_terms(query_topic)
+    if not terms:
+        return True
+    for doc in documents:
+        if len(terms & document_sketch(doc)) / len(terms) >= threshold:
+            return True
+    return False
@@ -0,0 +1,103 @@
+import threading
+import time
+
+import numpy as np
+
+
+def doc_set_key(docs):
+    """Order-independent key for a retrieved document set."""
+    return hash(frozenset(docs))
+
+
+class SemanticCache:
+    """Answer cache keyed on query-embedding similarity.
+
+    Entries live in a preallocated float32 matrix of unit vectors, so a
+    lookup is one masked matrix-vector product. A stored answer is reused
+    when a past query was answered from the same retrieved doc set and its
+    cosine similarity to the new query is at least threshold. When full,
+    the least recently used entry is replaced.
+    """
+
+    def __init__(self, dim=3072, capacity=1000, threshold=0.92):
+        self.dim = dim
+        self.capacity = capacity
+        self.threshold = threshold
+
+        self._vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self._doc_keys = np.zeros(capacity, dtype=np.int64)
+        self._last_used = np.zeros(capacity, dtype=np.float64)
+        self._answers = [None] * capacity
+        self._latencies = [0.0] * capacity
+        self._size = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    @staticmethod
+    def _unit(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _best_match(self, vector, doc_key):
+        """Return (slot, similarity) of the closest entry with the same doc set."""
+        candidates = np.flatnonzero(self._doc_keys[:self._size] == doc_key)
+        if len(candidates) == 0:
+            return None, 0.0
+        sims = self._vectors[candidates] @ vector
+        best = int(np.argmax(sims))
+        return int(candidates[best]), float(sims[best])
+
+    def lookup(self, query_embedding, docs):
+        vector = self._unit(query_embedding)
+        doc_key = doc_set_key(docs)
+        with self._lock:
+            slot, similarity = self._best_match(vector, doc_key)
+            if slot is not None and similarity >= self.threshold:
+                self._last_used[slot] = time.monotonic()
+                self.hits += 1
+                self.saved_seconds += self._latencies[slot]
+                print(f"Semantic cache hit (similarity {similarity:.3f}, hit rate {self.hit_rate():.1%}, "
+                      f"saved {self.saved_seconds:.1f}s so far).")
+                return self._answers[slot]
+            self.misses += 1
+            return None
+
+    def store(self, query_embedding, docs, answer, latency_seconds=0.0):
+        vector = self._unit(query_embedding)
+        doc_key = doc_set_key(docs)
+        with self._lock:
+            slot, similarity = self._best_match(vector, doc_key)
+            if slot is None or similarity < self.threshold:
+                if self._size < self.capacity:
+                    slot = self._size
+                    self._size += 1
+                else:
+                    slot = int(np.argmin(self._last_used))
+            self._vectors[slot] = vector
+            self._doc_keys[slot] = doc_key
+            self._answers[slot] = answer
+            self._latencies[slot] = latency_seconds
+            self._last_used[slot] = time.monotonic()
+
+    def clear(self):
+        with self._lock:
+            self._size = 0
+            self._answers = [None] * self.capacity
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": self._size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hit_rate(),
+                "saved_seconds": self.saved_seconds,
+            }
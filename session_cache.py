@@ -0,0 +1,159 @@
+import threading
+import time
+from collections import OrderedDict
+
+from token_counter import message_tokens
+
+# -----------------------------
+# Warm-instance session cache
+# -----------------------------
+class _Entry:
+    def __init__(self, version, generation, total, summary, messages):
+        self.version = version      # store-specific change marker (Cosmos: metadata ETag)
+        self.generation = generation  # changes whenever the session is cleared
+        self.total = total          # messages in the full history
+        self.summary = summary      # summary checkpoint or None
+        self.messages = messages    # the last len(messages) messages of the history
+        self.validated = time.monotonic()
+
+
+class SessionCache:
+    """LRU of recent sessions in front of a session store, with the same interface.
+
+    Each turn validates the cached session with one cheap read of its state
+    (store.load_session_state: version, clear generation, message count,
+    summary checkpoint).
+    When the version is unchanged no history is read. When other instances
+    added messages, only the messages newer than the cached tail are fetched;
+    when the session was cleared since (its generation changed), the history
+    is reloaded.
+    Writes made through the cache update it directly. Calls in the same turn
+    within `validate_seconds` of a validation are served without another read.
+    """
+
+    def __init__(self, store, capacity=256, max_messages=200, validate_seconds=1.0):
+        self.store = store
+        self.capacity = capacity
+        self.max_messages = max_messages
+        self.validate_seconds = validate_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.partial = 0
+        self.misses = 0
+
+    def __getattr__(self, name):
+        # list_sessions, iter_messages, ... go straight to the store
+        return getattr(self.store, name)
+
+    def _get(self, session_id):
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                self._entries.move_to_end(session_id)
+            return entry
+
+    def _put(self, session_id, entry):
+        if entry.messages is not None and len(entry.messages) > self.max_messages:
+            entry.messages = entry.messages[-self.max_messages:]
+        with self._lock:
+            self._entries[session_id] = entry
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def _drop(self, session_id):
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+    def _validate(self, session_id):
+        """Bring the cached entry up to date with the store; returns it, or None when the session is not cacheable."""
+        entry = self._get(session_id)
+        if entry is not None and time.monotonic() - entry.validated < self.validate_seconds:
+            return entry
+
+        state = self.store.load_session_state(session_id)
+        if state is None:
+            self._drop(session_id)
+            return None
+        if entry is None:
+            self.misses += 1
+            entry = _Entry(state["version"], state["generation"], state["count"], state["summary"], None)
+        elif entry.version == state["version"]:
+            self.hits += 1
+        else:
+            added = state["count"] - entry.total
+            appended = entry.generation == state["generation"] and 0 <= added <= self.max_messages
+            if entry.messages is not None and appended:
+                self.partial += 1
+                if added:
+                    entry.messages = entry.messages + self.store.load_messages(session_id, last_n=added)
+            else:
+                self.misses += 1
+                entry.messages = None  # cleared or too far behind: reload on demand
+            entry.version, entry.generation = state["version"], state["generation"]
+            entry.total, entry.summary = state["count"], state["summary"]
+        entry.validated = time.monotonic()
+        self._put(session_id, entry)
+        return entry
+
+    # -----------------------------
+    # Reads
+    # -----------------------------
+    def count_messages(self, session_id):
+        entry = self._validate(session_id)
+        return entry.total if entry is not None else self.store.count_messages(session_id)
+
+    def load_summary(self, session_id):
+        entry = self._validate(session_id)
+        return entry.summary if entry is not None else self.store.load_summary(session_id)
+
+    def load_messages(self, session_id, last_n=None):
+        entry = self._validate(session_id)
+        if entry is None:
+            return self.store.load_messages(session_id, last_n)
+        wanted = entry.total if last_n is None else min(last_n, entry.total)
+        if entry.messages is not None and wanted <= len(entry.messages):
+            return entry.messages[len(entry.messages) - wanted:]
+        messages = self.store.load_messages(session_id, last_n)
+        entry.messages = list(messages)
+        self._put(session_id, entry)
+        return messages
+
+    # -----------------------------
+    # Writes
+    # -----------------------------
+    def _append(self, session_id, messages):
+        entry = self._get(session_id)
+        if entry is None:
+            return
+        for msg in messages:
+            msg["tokens"] = message_tokens(msg)
+        if entry.messages is not None:
+            entry.messages = entry.messages + messages
+        entry.total += len(messages)
+        entry.version = None  # our own write; the next validation only refreshes the marker
+        self._put(session_id, entry)
+
+    def save_message(self, session_id, role, content):
+        self.store.save_message(session_id, role, content)
+        self._append(session_id, [{"role": role, "content": content}])
+
+    def save_turn(self, session_id, user_content, assistant_content, turn_id=None):
+        self.store.save_turn(session_id, user_content, assistant_content, turn_id)
+        self._append(session_id, [{"role": "user", "content": user_content},
+                                  {"role": "assistant", "content": assistant_content}])
+
+    def save_summary(self, session_id, summary, covered):
+        self.store.save_summary(session_id, summary, covered)
+        entry = self._get(session_id)
+        if entry is not None:
+            entry.summary = {"summary": summary, "covered": covered}
+
+    def clear_conversation(self, session_id):
+        self.store.clear_conversation(session_id)
+        self._drop(session_id)
+
+    def stats(self):
+        return {"sessions": len(self._entries), "hits": self.hits, "partial": self.partial, "misses": self.misses}
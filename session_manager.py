@@ -1,12 +1,31 @@
 import uuid
 import json
 import os
+import struct
+import threading
+from token_counter import message_tokens
 
 # Directory for session files
 SESSIONS_DIR = "sessions"
 if not os.path.exists(SESSIONS_DIR):
     os.makedirs(SESSIONS_DIR)
 
+# Append-only log settings
+SESSION_FSYNC_EVERY = int(os.getenv('SESSION_FSYNC_EVERY', '0'))        # fsync every N appends, 0 = leave it to the OS
+SESSION_COMPACT_EVERY = int(os.getenv('SESSION_COMPACT_EVERY', '1000'))  # compact a log every N appends, 0 = never
+SESSION_LOG_INDEX = os.getenv('SESSION_LOG_INDEX', '1') == '1'           # keep a sidecar offset index
+
+# Each session is sessions/<id>.jsonl (one JSON message per line), plus an
+# optional sessions/<id>.idx holding the byte offset of every line as a
+# little-endian uint64. Appends are O(1). A torn last line left by a crash is
+# ignored on read and cut off before the next append.
+OFFSET = struct.Struct("<Q")
+READ_BLOCK = 64 * 1024
+
+_lock = threading.RLock()
+_appends = {}      # session_id -> appends since last fsync / compaction
+_checked = set()   # sessions whose log tail was verified in this process
+
 # Initialize session
 session_id = str(uuid.uuid4())
 print(f"Your SessionID: {session_id}")
@@ -17,29 +36,293 @@ def restart_session():
     print(f"\nNew Session started. Your SessionID: {session_id}\n")
     return session_id
 
-def save_message(session_id, role, content):
-    session_file = os.path.join(SESSIONS_DIR, f"{session_id}.json")
-    messages = []
-    if os.path.exists(session_file):
-        with open(session_file, 'r') as f:
-            messages = json.load(f)
-    messages.append({
-        "id": str(uuid.uuid4()),
-        "role": role,
-        "content": content
-    })
-    with open(session_file, 'w') as f:
-        json.dump(messages, f, indent=4)
-
-def load_messages(session_id):
-    session_file = os.path.join(SESSIONS_DIR, f"{session_id}.json")
-    if not os.path.exists(session_file):
-        return []
-    with open(session_file, 'r') as f:
+def _path(session_id, suffix):
+    return os.path.join(SESSIONS_DIR, f"{session_id}{suffix}")
+
+def _record(role, content, tokens=None, record_id=None):
+    if tokens is None:
+        tokens = message_tokens({"role": role, "content": content})
+    record = {"id": record_id or str(uuid.uuid4()), "role": role, "content": content, "tokens": tokens}
+    return (json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8")
+
+def _write_atomic(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def _migrate_legacy(session_id):
+    """Convert an old sessions/<id>.json array into the log format."""
+    legacy_file = _path(session_id, ".json")
+    if not os.path.exists(legacy_file) or os.path.exists(_path(session_id, ".jsonl")):
+        return
+    with open(legacy_file, 'r') as f:
         messages = json.load(f)
-    return [{"role": msg["role"], "content": msg["content"]} for msg in messages]
+    lines = [_record(m["role"], m["content"], m.get("tokens")) for m in messages]
+    _write_atomic(_path(session_id, ".jsonl"), b"".join(lines))
+    _rebuild_index(session_id)
+    os.remove(legacy_file)
+
+def _rebuild_index(session_id):
+    if not SESSION_LOG_INDEX:
+        return
+    offsets, position = [], 0
+    log_file = _path(session_id, ".jsonl")
+    if os.path.exists(log_file):
+        with open(log_file, 'rb') as f:
+            for line in f:
+                if line.endswith(b"\n"):
+                    offsets.append(OFFSET.pack(position))
+                position += len(line)
+    _write_atomic(_path(session_id, ".idx"), b"".join(offsets))
+
+def _repair_tail(session_id):
+    """Drop a partial last line and realign the index with the log (once per session per process)."""
+    if session_id in _checked:
+        return
+    _migrate_legacy(session_id)
+    log_file = _path(session_id, ".jsonl")
+    if os.path.exists(log_file):
+        with open(log_file, 'rb+') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            if size:
+                f.seek(size - 1)
+                if f.read(1) != b"\n":
+                    tail = _read_tail_lines(f, size, 1, keep_partial=True)
+                    f.truncate(size - len(tail[-1]) if tail else 0)
+        if SESSION_LOG_INDEX and not _index_valid(session_id):
+            _rebuild_index(session_id)
+    _checked.add(session_id)
+
+def _index_valid(session_id):
+    index_file = _path(session_id, ".idx")
+    log_file = _path(session_id, ".jsonl")
+    if not os.path.exists(index_file):
+        return False
+    index_size = os.path.getsize(index_file)
+    if index_size % OFFSET.size:
+        return False
+    if index_size == 0:
+        return os.path.getsize(log_file) == 0
+    with open(index_file, 'rb') as f:
+        f.seek(index_size - OFFSET.size)
+        (last,) = OFFSET.unpack(f.read(OFFSET.size))
+    with open(log_file, 'rb') as f:
+        if last:
+            f.seek(last - 1)
+            if f.read(1) != b"\n":
+                return False
+        f.seek(last)
+        return f.read().count(b"\n") == 1
+
+def _read_tail_lines(f, size, n, keep_partial=False):
+    """Read the last n complete lines by seeking backwards from the end of the file."""
+    data, position = b"", size
+    while position > 0 and data.count(b"\n") <= n:
+        step = min(READ_BLOCK, position)
+        position -= step
+        f.seek(position)
+        data = f.read(step) + data
+    lines = data.split(b"\n")
+    partial = lines.pop()  # b"" when the file ends with a newline
+    if position > 0:
+        lines = lines[1:]  # first piece may be cut mid-line
+    if keep_partial:
+        return lines[-n:] + [partial] if partial else lines[-n:]
+    return lines[-n:] if n else []
+
+def _parse(data):
+    """Parse a block of complete log lines with a single json.loads call."""
+    data = data.strip(b"\n")
+    if not data:
+        return []
+    records = json.loads(b"[" + data.replace(b"\n", b",") + b"]")
+    return [{"role": msg["role"], "content": msg["content"], "tokens": msg.get("tokens")} for msg in records]
+
+def _append(session_id, records):
+    with _lock:
+        _repair_tail(session_id)
+        offsets = []
+        try:
+            with open(_path(session_id, ".jsonl"), 'ab') as f:
+                offset = f.tell()
+                for data in records:
+                    offsets.append(OFFSET.pack(offset))
+                    offset += len(data)
+                f.write(b"".join(records))
+                before = _appends.get(session_id, 0)
+                count = before + len(records)
+                if SESSION_FSYNC_EVERY and count // SESSION_FSYNC_EVERY > before // SESSION_FSYNC_EVERY:
+                    f.flush()
+                    os.fsync(f.fileno())
+            if SESSION_LOG_INDEX:
+                with open(_path(session_id, ".idx"), 'ab') as f:
+                    f.write(b"".join(offsets))
+        except Exception:
+            # A torn line or missing offsets: check the tail again before the next read or write
+            _checked.discard(session_id)
+            raise
+        _appends[session_id] = count
+        if SESSION_COMPACT_EVERY and count // SESSION_COMPACT_EVERY > before // SESSION_COMPACT_EVERY:
+            compact(session_id)
+
+def save_message(session_id, role, content):
+    _append(session_id, [_record(role, content)])
+
+def _last_record_id(session_id):
+    log_file = _path(session_id, ".jsonl")
+    if not os.path.exists(log_file):
+        return None
+    with open(log_file, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        lines = _read_tail_lines(f, f.tell(), 1)
+    return json.loads(lines[0]).get("id") if lines else None
+
+def save_turn(session_id, user_content, assistant_content, turn_id=None):
+    """Append both messages of a turn; a retry of a turn already (partly) in the log appends only what is missing."""
+    turn_id = turn_id or str(uuid.uuid4())
+    records = [_record("user", user_content, record_id=f"{turn_id}-user"),
+               _record("assistant", assistant_content, record_id=f"{turn_id}-assistant")]
+    with _lock:
+        _repair_tail(session_id)
+        last_id = _last_record_id(session_id)
+        if last_id == f"{turn_id}-assistant":
+            return
+        if last_id == f"{turn_id}-user":
+            records = records[1:]
+        _append(session_id, records)
+
+def load_messages(session_id, last_n=None):
+    """All messages of a session, or only the last `last_n` without reading the whole log."""
+    with _lock:
+        _repair_tail(session_id)
+        log_file = _path(session_id, ".jsonl")
+        if not os.path.exists(log_file):
+            return []
+        with open(log_file, 'rb') as f:
+            if last_n is None:
+                data = f.read()
+                return _parse(data[:data.rfind(b"\n") + 1])
+            if last_n <= 0:
+                return []
+            index_file = _path(session_id, ".idx")
+            if SESSION_LOG_INDEX and os.path.exists(index_file):
+                with open(index_file, 'rb') as idx:
+                    idx.seek(0, os.SEEK_END)
+                    idx.seek(max(0, idx.tell() - last_n * OFFSET.size))
+                    first = idx.read(OFFSET.size)
+                if not first:
+                    return []
+                f.seek(OFFSET.unpack(first)[0])
+                return _parse(f.read())
+            f.seek(0, os.SEEK_END)
+            return _parse(b"\n".join(_read_tail_lines(f, f.tell(), last_n)))
+
+def load_history_page(session_id, page_size=50, cursor=None):
+    """One page of history, newest page first; returns (messages oldest-first, cursor for the previous page or None).
+
+    The cursor is the position of the first message already returned.
+    """
+    with _lock:
+        end = int(cursor) if cursor else count_messages(session_id)
+        start = max(0, end - page_size)
+        index_file = _path(session_id, ".idx")
+        if end <= start:
+            return [], None
+        if SESSION_LOG_INDEX and os.path.exists(index_file):
+            with open(index_file, 'rb') as idx:
+                idx.seek(start * OFFSET.size)
+                offsets = idx.read((end - start + 1) * OFFSET.size)
+            with open(_path(session_id, ".jsonl"), 'rb') as f:
+                f.seek(OFFSET.unpack_from(offsets, 0)[0])
+                if len(offsets) > (end - start) * OFFSET.size:
+                    data = f.read(OFFSET.unpack_from(offsets, (end - start) * OFFSET.size)[0] - f.tell())
+                else:
+                    data = f.read()
+            messages = _parse(data[:data.rfind(b"\n") + 1])
+        else:
+            messages = load_messages(session_id)[start:end]
+    return messages, (str(start) if start > 0 else None)
+
+def count_messages(session_id):
+    with _lock:
+        _repair_tail(session_id)
+        if SESSION_LOG_INDEX and os.path.exists(_path(session_id, ".idx")):
+            return os.path.getsize(_path(session_id, ".idx")) // OFFSET.size
+        log_file = _path(session_id, ".jsonl")
+        if not os.path.exists(log_file):
+            return 0
+        with open(log_file, 'rb') as f:
+            return sum(chunk.count(b"\n") for chunk in iter(lambda: f.read(READ_BLOCK), b""))
+
+def load_session_state(session_id):
+    log_file = _path(session_id, ".jsonl")
+    summary_file = _path(session_id, ".summary.json")
+    if not os.path.exists(log_file):
+        return None
+    log = os.stat(log_file)
+    summary_mtime = os.stat(summary_file).st_mtime_ns if os.path.exists(summary_file) else None
+    with open(log_file, 'rb') as f:
+        first = f.readline()
+    return {
+        "version": (log.st_mtime_ns, log.st_size, summary_mtime),
+        # Clearing deletes the log, so the first record's id changes when a session is refilled
+        "generation": json.loads(first).get("id") if first.endswith(b"\n") else None,
+        "count": count_messages(session_id),
+        "summary": load_summary(session_id)
+    }
+
+def compact(session_id):
+    """Rewrite a session log in place: drops torn or blank lines and rebuilds the offset index."""
+    log_file = _path(session_id, ".jsonl")
+    with _lock:
+        if not os.path.exists(log_file):
+            return
+        with open(log_file, 'rb') as f:
+            lines = [line for line in f if line.endswith(b"\n") and line.strip()]
+        _write_atomic(log_file, b"".join(lines))
+        _rebuild_index(session_id)
 
 def clear_conversation(session_id):
-    session_file = os.path.join(SESSIONS_DIR, f"{session_id}.json")
-    if os.path.exists(session_file):
-        os.remove(session_file)
+    with _lock:
+        for suffix in (".jsonl", ".idx", ".json", ".summary.json"):
+            path = _path(session_id, suffix)
+            if os.path.exists(path):
+                os.remove(path)
+        _appends.pop(session_id, None)
+        _checked.discard(session_id)
+
+def list_sessions(page_size=50, continuation=None):
+    """One page of sessions with a log, most recently written first; returns (sessions, continuation token or None)."""
+    logs = [name for name in os.listdir(SESSIONS_DIR) if name.endswith(".jsonl")]
+    logs.sort(key=lambda name: os.path.getmtime(os.path.join(SESSIONS_DIR, name)), reverse=True)
+    start = int(continuation or 0)
+    sessions = []
+    for name in logs[start:start + page_size]:
+        session_id = name[:-len(".jsonl")]
+        title = 'Untitled'
+        with open(os.path.join(SESSIONS_DIR, name), 'rb') as f:
+            for line in f:
+                msg = json.loads(line) if line.endswith(b"\n") else {}
+                if msg.get("role") == "user":
+                    title = msg["content"][:20] + '...'
+                    break
+        sessions.append({"id": session_id, "title": title,
+                         "updatedAt": os.path.getmtime(os.path.join(SESSIONS_DIR, name)),
+                         "messageCount": count_messages(session_id)})
+    token = str(start + page_size) if start + page_size < len(logs) else None
+    return sessions, token
+
+def load_summary(session_id):
+    summary_file = _path(session_id, ".summary.json")
+    if not os.path.exists(summary_file):
+        return None
+    with open(summary_file, 'r') as f:
+        return json.load(f)
+
+def save_summary(session_id, summary, covered):
+    _write_atomic(_path(session_id, ".summary.json"),
+                  json.dumps({"summary": summary, "covered": covered}, indent=4).encode("utf-8"))
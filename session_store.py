@@ -0,0 +1,29 @@
+from config import SESSION_STORE, SESSION_CACHE_SIZE
+from session_cache import SessionCache
+
+# -----------------------------
+# Session store selection
+# -----------------------------
+# Every store module exposes save_message, load_messages (optionally only the
+# last N), save_turn, count_messages, load_session_state, clear_conversation,
+# list_sessions, load_summary and save_summary. Stores are imported lazily so
+# picking SQLite or files never connects to Cosmos DB.
+
+
+def _load_store(name):
+    if name == "cosmos":
+        import cosmos_store
+        return cosmos_store
+    if name == "sqlite":
+        import sqlite_store
+        return sqlite_store
+    if name == "file":
+        import session_manager
+        return session_manager
+    raise ValueError(f"Unknown session store: {name}")
+
+
+def get_session_store(name=SESSION_STORE, cache_size=SESSION_CACHE_SIZE):
+    """The configured store, behind a warm-instance SessionCache unless cache_size is 0."""
+    store = _load_store(name)
+    return SessionCache(store, capacity=cache_size) if cache_size > 0 else store
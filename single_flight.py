@@ -0,0 +1,162 @@
+import asyncio
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+# -----------------------------
+# Single-flight coalescing of identical in-flight calls
+# -----------------------------
+_flights = {}
+
+
+def _retrieve(future):
+    # Mark the exception as seen: when every waiter has gone, asyncio would log it as never retrieved
+    if not future.cancelled():
+        future.exception()
+
+
+class SingleFlight:
+    """Share one execution among concurrent callers that ask for the same key.
+
+    The first caller for a key (the leader) runs the call; callers that
+    arrive while it is in flight wait for its result instead of repeating
+    it, and get its exception if it fails. A waiter gives up after `timeout`
+    seconds and makes the call itself, so a slow leader delays the others by
+    at most that long. Nothing is kept once the call finishes; caching is
+    left to the caches around it, and a None result is not shared (waiters
+    make the call themselves). A timeout of 0 turns coalescing off.
+
+    Threads use do() (or join/wait/finish when the leader produces its
+    result incrementally, as a stream); coroutines use ado() (or ajoin/
+    await_result/finish). The two are tracked separately.
+    """
+
+    def __init__(self, name, timeout=30.0):
+        self.name = name
+        self.timeout = timeout
+        self._calls = {}        # key -> concurrent.futures.Future
+        self._async_calls = {}  # key -> asyncio.Future or Task
+        self._lock = threading.Lock()
+
+        self.calls = 0
+        self.coalesced = 0
+        self.timeouts = 0
+        self.errors = 0
+        _flights[name] = self
+
+    # -----------------------------
+    # Leader / waiter bookkeeping
+    # -----------------------------
+    def _join(self, table, key, new_future):
+        with self._lock:
+            self.calls += 1
+            future = table.get(key)
+            if future is None:
+                future = table[key] = new_future()
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+        if not leader:
+            print(f"[{self.name}] joining in-flight call.")
+            return future, False
+        future.add_done_callback(lambda done: self._done(table, key, done))
+        return future, True
+
+    def _done(self, table, key, future):
+        with self._lock:
+            if table.get(key) is future:
+                del table[key]
+            if not future.cancelled() and future.exception() is not None:
+                self.errors += 1
+
+    def _timed_out(self, key):
+        with self._lock:
+            self.timeouts += 1
+        print(f"[{self.name}] in-flight call for {key!r} took longer than {self.timeout:g}s, calling directly")
+
+    def join(self, key):
+        """(future, True) for the leader, who must finish() it; (future, False) for a waiter."""
+        return self._join(self._calls, key, Future)
+
+    def ajoin(self, key):
+        """join() for coroutines; the future belongs to the running event loop."""
+        future, leader = self._join(self._async_calls, key, asyncio.get_running_loop().create_future)
+        if leader:
+            future.add_done_callback(_retrieve)
+        return future, leader
+
+    @staticmethod
+    def finish(future, result=None, error=None):
+        """Hand the leader's result (or exception) to every waiter; a None result sends them to call directly."""
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def wait(self, key, future, timeout=None):
+        """The leader's result, or its exception; None when the wait timed out or the leader gave up
+        (call directly then)."""
+        try:
+            return future.result(timeout=timeout or self.timeout)
+        except FutureTimeoutError:
+            self._timed_out(key)
+            return None
+
+    async def await_result(self, key, future, timeout=None):
+        """wait() for coroutines."""
+        try:
+            # shield: a waiter that times out or is cancelled must not cancel the shared result
+            return await asyncio.wait_for(asyncio.shield(future), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            self._timed_out(key)
+            return None
+
+    # -----------------------------
+    # Calls
+    # -----------------------------
+    def do(self, key, fn, *args, timeout=None):
+        """fn(*args), shared with concurrent do() calls for the same key."""
+        if not self.timeout:
+            return fn(*args)
+        future, leader = self.join(key)
+        if not leader:
+            result = self.wait(key, future, timeout)
+            return result if result is not None else fn(*args)
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            self.finish(future, error=e)
+            raise
+        self.finish(future, result)
+        return result
+
+    async def ado(self, key, coroutine_fn, *args, timeout=None):
+        """await coroutine_fn(*args), shared with concurrent ado() calls for the same key.
+
+        The call runs as its own task, so it completes for the waiters even
+        if the caller that started it is cancelled.
+        """
+        if not self.timeout:
+            return await coroutine_fn(*args)
+        task, leader = self._join(self._async_calls, key, lambda: asyncio.ensure_future(coroutine_fn(*args)))
+        if leader:
+            task.add_done_callback(_retrieve)
+            return await asyncio.shield(task)
+        result = await self.await_result(key, task, timeout)
+        return result if result is not None else await coroutine_fn(*args)
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "in_flight": len(self._calls) + len(self._async_calls),
+        }
+
+
+def stats():
+    """Counters for every single-flight group, by name."""
+    return {name: flight.stats() for name, flight in _flights.items()}
@@ -0,0 +1,194 @@
+import json
+import sqlite3
+import threading
+import time
+from config import SESSION_DB_PATH
+from token_counter import message_tokens
+
+# -----------------------------
+# SQLite session store (WAL)
+# -----------------------------
+# Same interface as cosmos_store and session_manager, for single-node
+# deployments and for running without network access.
+TITLE_LENGTH = 20
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    ts REAL NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    tokens INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_messages_session_ts ON messages (session_id, ts);
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    title TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    summary TEXT,
+    covered INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions (updated_at, session_id);
+"""
+
+# Statements are constants so sqlite3's per-connection statement cache reuses them
+INSERT_MESSAGE = "INSERT INTO messages (session_id, ts, role, content, tokens) VALUES (?, ?, ?, ?, ?)"
+TOUCH_SESSION = """
+INSERT INTO sessions (session_id, title, created_at, updated_at, message_count) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (session_id) DO UPDATE SET
+    title = COALESCE(sessions.title, excluded.title),
+    updated_at = excluded.updated_at,
+    message_count = sessions.message_count + excluded.message_count
+"""
+SELECT_MESSAGES = "SELECT role, content, tokens FROM messages WHERE session_id = ? ORDER BY ts, id"
+SELECT_LAST_MESSAGES = """
+SELECT role, content, tokens FROM (
+    SELECT id, ts, role, content, tokens FROM messages WHERE session_id = ? ORDER BY ts DESC, id DESC LIMIT ?
+) ORDER BY ts, id
+"""
+SELECT_STATE = "SELECT created_at, updated_at, message_count, summary, covered FROM sessions WHERE session_id = ?"
+SELECT_HISTORY_PAGE = """
+SELECT id, ts, role, content, tokens FROM messages
+WHERE session_id = ? AND (ts, id) < (?, ?) ORDER BY ts DESC, id DESC LIMIT ?
+"""
+COUNT_MESSAGES = "SELECT message_count FROM sessions WHERE session_id = ?"
+SESSIONS_PAGE_SIZE = 50
+HISTORY_PAGE_SIZE = 50
+SELECT_SESSIONS = """
+SELECT session_id, title, updated_at, message_count FROM sessions
+WHERE (updated_at, session_id) < (?, ?) ORDER BY updated_at DESC, session_id DESC LIMIT ?
+"""
+SELECT_SUMMARY = "SELECT summary, covered FROM sessions WHERE session_id = ? AND summary IS NOT NULL"
+SAVE_SUMMARY = """
+INSERT INTO sessions (session_id, created_at, updated_at, summary, covered) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (session_id) DO UPDATE SET summary = excluded.summary, covered = excluded.covered
+"""
+
+_local = threading.local()
+
+
+def get_connection():
+    """One connection per thread; WAL lets readers run while another thread writes."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(SESSION_DB_PATH, timeout=30, cached_statements=64)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        _local.conn = conn
+    return conn
+
+
+def close():
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+
+def _title(messages):
+    for role, content in messages:
+        if role == "user":
+            return content[:TITLE_LENGTH] + '...'
+    return None
+
+
+def save_messages(session_id, messages):
+    """Insert (role, content) pairs in one transaction and update the session row once."""
+    if not messages:
+        return
+    now = time.time()
+    rows = [(session_id, now + i * 1e-6, role, content, message_tokens({"role": role, "content": content}))
+            for i, (role, content) in enumerate(messages)]
+    conn = get_connection()
+    with conn:
+        conn.executemany(INSERT_MESSAGE, rows)
+        conn.execute(TOUCH_SESSION, (session_id, _title(messages), now, now, len(rows)))
+
+
+def save_message(session_id, role, content):
+    save_messages(session_id, [(role, content)])
+
+
+def save_turn(session_id, user_content, assistant_content, turn_id=None):
+    # One transaction: a failed write was rolled back, so retries cannot duplicate it
+    save_messages(session_id, [("user", user_content), ("assistant", assistant_content)])
+
+
+def load_messages(session_id, last_n=None):
+    conn = get_connection()
+    if last_n is None:
+        rows = conn.execute(SELECT_MESSAGES, (session_id,)).fetchall()
+    elif last_n <= 0:
+        return []
+    else:
+        rows = conn.execute(SELECT_LAST_MESSAGES, (session_id, last_n)).fetchall()
+    return [{"role": role, "content": content, "tokens": tokens} for role, content, tokens in rows]
+
+
+def load_history_page(session_id, page_size=HISTORY_PAGE_SIZE, cursor=None):
+    """One page of history, newest page first; returns (messages oldest-first, cursor for the previous page or None)."""
+    before = json.loads(cursor) if cursor else [float("inf"), 0]
+    rows = get_connection().execute(SELECT_HISTORY_PAGE, (session_id, before[0], before[1], page_size)).fetchall()
+    rows.reverse()
+    messages = [{"role": role, "content": content, "tokens": tokens} for _, _, role, content, tokens in rows]
+    token = json.dumps([rows[0][1], rows[0][0]]) if len(rows) == page_size else None
+    return messages, token
+
+
+def count_messages(session_id):
+    row = get_connection().execute(COUNT_MESSAGES, (session_id,)).fetchone()
+    return row[0] if row else 0
+
+
+def load_session_state(session_id):
+    row = get_connection().execute(SELECT_STATE, (session_id,)).fetchone()
+    if row is None:
+        return None
+    created_at, updated_at, count, summary, covered = row
+    return {
+        "version": (updated_at, count, covered),
+        "generation": created_at,  # clearing deletes the row, so a refilled session gets a new one
+        "count": count,
+        "summary": {"summary": summary, "covered": covered} if summary is not None else None
+    }
+
+
+def clear_conversation(session_id):
+    conn = get_connection()
+    with conn:
+        conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+        conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+
+def list_sessions(page_size=SESSIONS_PAGE_SIZE, continuation=None):
+    """One page of sessions, most recently active first; returns (sessions, continuation token or None).
+
+    The token is the (updated_at, session_id) of the last row, so each page is an index range scan.
+    """
+    after = json.loads(continuation) if continuation else [float("inf"), ""]
+    rows = get_connection().execute(SELECT_SESSIONS, (after[0], after[1], page_size)).fetchall()
+    sessions = [{"id": session_id, "title": title or 'Untitled', "updatedAt": updated_at, "messageCount": count}
+                for session_id, title, updated_at, count in rows]
+    token = json.dumps([rows[-1][2], rows[-1][0]]) if len(rows) == page_size else None
+    return sessions, token
+
+
+# -----------------------------
+# Summary checkpoints
+# -----------------------------
+def load_summary(session_id):
+    row = get_connection().execute(SELECT_SUMMARY, (session_id,)).fetchone()
+    if row is None:
+        return None
+    return {"summary": row[0], "covered": row[1]}
+
+
+def save_summary(session_id, summary, covered):
+    now = time.time()
+    conn = get_connection()
+    with conn:
+        conn.execute(SAVE_SUMMARY, (session_id, now, now, summary, covered))
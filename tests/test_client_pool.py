@@ -0,0 +1,139 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from openai import APIStatusError, RateLimitError
+
+from client_pool import AsyncClientPool, ClientPool, Deployment
+from rate_limiter import RateGovernor
+
+REQUEST = httpx.Request("POST", "https://stub.openai.azure.com/openai/deployments/gpt-4o/chat/completions")
+
+
+def status_error(status, cls=APIStatusError):
+    return cls(f"HTTP {status}", response=httpx.Response(status, request=REQUEST), body=None)
+
+
+class StubEndpoint:
+    """A mock deployment: each create() sleeps `latency` seconds, then raises the next scripted error or answers."""
+
+    def __init__(self, name, latency=0.0, errors=()):
+        self.name = name
+        self.latency = latency
+        self.errors = list(errors)
+        self.calls = 0
+        self.governor = RateGovernor(name, rpm=600, tpm=100_000)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+        self.embeddings = SimpleNamespace(create=self.create)
+
+    def _answer(self):
+        self.calls += 1
+        if self.errors:
+            error = self.errors.pop(0)
+            if error is not None:
+                raise error
+        return self.name
+
+    def create(self, **kwargs):
+        time.sleep(self.latency)
+        return self._answer()
+
+
+class AsyncStubEndpoint(StubEndpoint):
+    async def create(self, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self._answer()
+
+
+def pool_of(*endpoints, pool_class=ClientPool, **options):
+    options.setdefault("explore", 0.0)
+    return pool_class([Deployment(endpoint.name, endpoint) for endpoint in endpoints], **options)
+
+
+def test_throttled_and_failing_calls_fail_over():
+    primary = StubEndpoint("primary", errors=[status_error(429, RateLimitError), status_error(503)])
+    secondary = StubEndpoint("secondary")
+    pool = pool_of(primary, secondary)
+
+    assert pool.chat.completions.create(model="gpt-4o", messages=[]) == "secondary"
+    assert pool.embeddings.create(model="embed", input="x") == "secondary"
+    assert primary.calls == 2
+    assert pool.stats()["primary"]["failures"] == 2
+
+
+def test_client_errors_are_raised_without_failing_over():
+    primary = StubEndpoint("primary", errors=[status_error(400)])
+    secondary = StubEndpoint("secondary")
+    pool = pool_of(primary, secondary)
+
+    with pytest.raises(APIStatusError):
+        pool.chat.completions.create(model="gpt-4o", messages=[])
+    assert secondary.calls == 0
+
+
+def test_circuit_opens_after_consecutive_failures():
+    flaky = StubEndpoint("flaky", errors=[status_error(500)] * 2)
+    steady = StubEndpoint("steady", latency=0.01)
+    pool = pool_of(flaky, steady, failure_threshold=2, cooldown=60)
+
+    pool.chat.completions.create(model="gpt-4o", messages=[])
+    flaky.errors = [status_error(500)]
+    pool.chat.completions.create(model="gpt-4o", messages=[])
+    assert pool.stats()["flaky"]["circuit_open"]
+
+    calls = flaky.calls
+    for _ in range(5):
+        assert pool.chat.completions.create(model="gpt-4o", messages=[]) == "steady"
+    # flaky is faster (unmeasured) but skipped while its circuit is open
+    assert flaky.calls == calls
+
+
+def test_half_open_probe_closes_the_circuit_on_success():
+    first = StubEndpoint("first")
+    second = StubEndpoint("second")
+    pool = pool_of(first, second, failure_threshold=1, cooldown=60)
+    for deployment in pool.deployments:
+        deployment.record(failed=True, failure_threshold=1, cooldown=60)
+    pool.deployments[0].open_until -= 30  # its cooldown ends first
+
+    # Every circuit is open: the deployment closest to the end of its cooldown is probed
+    assert pool.chat.completions.create(model="gpt-4o", messages=[]) == "first"
+    assert not pool.stats()["first"]["circuit_open"]
+    assert pool.stats()["second"]["circuit_open"]
+
+
+def test_routes_to_the_lowest_ewma_latency():
+    slow = StubEndpoint("slow", latency=0.03)
+    fast = StubEndpoint("fast", latency=0.005)
+    pool = pool_of(slow, fast)
+
+    # Unmeasured deployments are tried first, then the fastest one keeps the traffic
+    answers = [pool.chat.completions.create(model="gpt-4o", messages=[]) for _ in range(6)]
+    assert answers.count("fast") == 5
+    assert pool.stats()["fast"]["ewma_latency"] < pool.stats()["slow"]["ewma_latency"]
+
+
+def test_routing_avoids_a_deployment_paused_after_a_429():
+    fast = StubEndpoint("fast", latency=0.001)
+    slow = StubEndpoint("slow", latency=0.02)
+    pool = pool_of(fast, slow)
+    for _ in range(4):
+        pool.chat.completions.create(model="gpt-4o", messages=[])
+    assert fast.calls > slow.calls
+
+    fast.governor.pause(5)
+    assert 4 < fast.governor.paused_for() <= 5
+    calls = fast.calls
+    assert pool.chat.completions.create(model="gpt-4o", messages=[]) == "slow"
+    assert fast.calls == calls
+
+
+def test_async_pool_fails_over():
+    primary = AsyncStubEndpoint("primary", errors=[status_error(429, RateLimitError)])
+    secondary = AsyncStubEndpoint("secondary")
+    pool = pool_of(primary, secondary, pool_class=AsyncClientPool)
+
+    assert asyncio.run(pool.chat.completions.create(model="gpt-4o", messages=[])) == "secondary"
+    assert pool.stats()["primary"]["failures"] == 1
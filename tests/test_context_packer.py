@@ -0,0 +1,61 @@
+import pytest
+
+import context_packer
+import token_counter
+from context_packer import pack_documents, pack_prompt
+from token_counter import count_tokens
+
+
+class WordEncoding:
+    """One token per word; stands in for tiktoken when its BPE file is not vendored (no download in tests)."""
+
+    name = "words"
+
+    def encode(self, text):
+        return text.split()
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+
+@pytest.fixture(autouse=True)
+def encoding(monkeypatch):
+    if token_counter.missing_vendored_encodings():
+        monkeypatch.setattr(token_counter, "get_encoding", lambda model=None: WordEncoding())
+        monkeypatch.setattr(context_packer, "get_encoding", lambda model=None: WordEncoding())
+    count_tokens.cache_clear()
+    yield
+    count_tokens.cache_clear()
+
+
+# search_documents() results as the chat turn receives them: content plus cosine score,
+# not in score order
+RESULTS = [
+    {"content": "Transformers use self-attention to weigh every token against the others.", "score": 0.71},
+    {"content": "Retrieval-augmented generation adds retrieved documents to the prompt.", "score": 0.89},
+    {"content": "Tokenizers split text into subword units.", "score": 0.52},
+]
+
+
+def test_pack_documents_orders_search_results_by_score():
+    texts, _ = pack_documents(RESULTS, 10_000)
+    assert texts == [RESULTS[1]["content"], RESULTS[0]["content"], RESULTS[2]["content"]]
+
+
+def test_pack_documents_keeps_the_best_result_when_the_budget_is_tight():
+    budget = count_tokens(RESULTS[1]["content"])
+    texts, used = pack_documents(RESULTS, budget)
+    assert texts == [RESULTS[1]["content"]]
+    assert used == budget
+
+
+def test_pack_prompt_puts_the_best_result_first():
+    messages = pack_prompt("You are a helpful assistant.", RESULTS, [], "What is RAG?", 4096)
+    context = messages[1]["content"]
+    assert context.index("Retrieval-augmented") < context.index("Transformers") < context.index("Tokenizers")
+    assert messages[-1] == {"role": "user", "content": "What is RAG?"}
+
+
+def test_pack_documents_accepts_plain_text():
+    texts, _ = pack_documents([doc["content"] for doc in RESULTS], 10_000)
+    assert texts == [doc["content"] for doc in RESULTS]
@@ -0,0 +1,21 @@
+from relevance import is_query_related
+
+# search_documents() results: content plus cosine score
+ON_TOPIC = [{"content": "Transformers use self-attention.", "score": 0.52},
+            {"content": "RNNs process tokens in sequence.", "score": 0.31}]
+OFF_TOPIC = [{"content": "Transformers use self-attention.", "score": 0.14}]
+
+
+def test_gate_uses_the_best_retrieval_score():
+    assert is_query_related("how do transformers compare to rnns", ON_TOPIC, min_score=0.3)
+    assert not is_query_related("best pizza in rome", OFF_TOPIC, min_score=0.3)
+
+
+def test_gate_lets_greetings_through():
+    assert is_query_related("hello, thanks!", OFF_TOPIC, min_score=0.3)
+
+
+def test_gate_falls_back_to_terms_for_plain_text():
+    docs = [doc["content"] for doc in ON_TOPIC]
+    assert is_query_related("what is self-attention", docs, min_score=0.3)
+    assert not is_query_related("best pizza in rome", docs, min_score=0.3)
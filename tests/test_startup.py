@@ -0,0 +1,58 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from benchmarks.profile_startup import ROOT, profile
+from token_counter import TIKTOKEN_VENDOR_DIR, VENDORED_ENCODINGS, missing_vendored_encodings
+
+# SDKs the Function handler must not load before a route needs them
+HEAVY_MODULES = ("openai", "azure.cosmos", "azure.search", "tiktoken")
+
+# Cold import of the handler on a developer machine is well under this; raise it on slow CI runners
+IMPORT_BUDGET_MS = float(os.getenv("STARTUP_IMPORT_BUDGET_MS", "250"))
+
+# A deployment without vendor/tiktoken downloads the tokenizer on its first chat turn;
+# set to 0 only where the files cannot be fetched (no network)
+VENDOR_REQUIRED = os.getenv("TIKTOKEN_VENDOR_REQUIRED", "1") == "1"
+
+# Loads every vendored encoding in a fresh interpreter with tiktoken's download disabled
+LOAD_OFFLINE = """
+import tiktoken, tiktoken.load
+def offline(path):
+    raise OSError(f"downloaded {path}")
+tiktoken.load.read_file = offline
+import token_counter
+token_counter.get_encoding()  # points tiktoken's cache at the vendor directory
+for name in token_counter.VENDORED_ENCODINGS:
+    tiktoken.get_encoding(name)
+"""
+
+
+def _imported(modules):
+    return {name.strip() for _, _, name in modules}
+
+
+def test_handler_import_does_not_load_heavy_sdks():
+    _, modules = profile("online-chat/init.py")
+    imported = _imported(modules)
+    loaded = [heavy for heavy in HEAVY_MODULES
+              if any(name == heavy or name.startswith(heavy + ".") for name in imported)]
+    assert not loaded, f"online-chat/init.py imports {loaded} at load time"
+
+
+def test_handler_import_stays_within_budget():
+    # Best of three, so one slow run on a busy machine does not fail the build
+    wall_ms = min(profile("online-chat/init.py")[0] for _ in range(3))
+    assert wall_ms <= IMPORT_BUDGET_MS, f"importing online-chat/init.py took {wall_ms:.1f} ms"
+
+
+def test_tokenizer_is_vendored():
+    if not VENDOR_REQUIRED:
+        pytest.skip("TIKTOKEN_VENDOR_REQUIRED=0")
+    missing = missing_vendored_encodings()
+    assert not missing, f"{missing} not in {TIKTOKEN_VENDOR_DIR}; run python token_counter.py --vendor"
+    env = {name: value for name, value in os.environ.items() if name != "TIKTOKEN_CACHE_DIR"}
+    result = subprocess.run([sys.executable, "-c", LOAD_OFFLINE], capture_output=True, text=True, cwd=ROOT, env=env)
+    assert result.returncode == 0, f"loading {VENDORED_ENCODINGS} offline failed:\n{result.stderr[-2000:]}"
@@ -0,0 +1,120 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+import tools
+from tools import execute_tool_calls, aexecute_tool_calls, get_course_recommendations, parse_course_links
+
+SEARCH_PAGE = """<html><body>
+<a href="/about">About</a>
+<a href="/learn/{slug}-basics">{topic} Basics</a>
+<a href="/specializations/{slug}">{topic} &amp; Practice</a>
+<a href="/learn/{slug}-advanced">Advanced {topic}</a>
+<a href="/learn/{slug}-extra">Not listed</a>
+</body></html>"""
+
+FETCH_DELAY = 0.2  # seconds the fixture server takes per search
+DOCS = ["Machine learning, deep learning and neural networks are covered in this course material."]
+
+
+class CourseraFixture(BaseHTTPRequestHandler):
+    """A local stand-in for the Coursera search page that records its searches and client ports."""
+
+    protocol_version = "HTTP/1.1"  # keep-alive, so connection reuse shows as a repeated client port
+    searches = []
+    ports = []
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        topic = parse_qs(url.query).get("query", [""])[0]
+        type(self).searches.append(topic)
+        type(self).ports.append(self.client_address[1])
+        time.sleep(FETCH_DELAY)
+        body = SEARCH_PAGE.format(topic=topic.title(), slug=topic.lower().replace(" ", "-")).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def coursera(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), CourseraFixture)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    CourseraFixture.searches = []
+    CourseraFixture.ports = []
+    monkeypatch.setattr(tools, "COURSERA_BASE_URL", f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setattr(tools, "_course_cache", tools.OrderedDict())
+    monkeypatch.setattr(tools, "_async_http_client", None)  # bound to the event loop that created it
+    yield CourseraFixture.searches
+    server.shutdown()
+    server.server_close()
+
+
+def test_parse_course_links_keeps_course_anchors_up_to_the_limit():
+    courses = parse_course_links(SEARCH_PAGE.format(topic="Python", slug="python"))
+    assert [course["name"] for course in courses] == ["Python Basics", "Python & Practice", "Advanced Python"]
+    assert courses[0]["url"] == f"{tools.COURSERA_BASE_URL}/learn/python-basics"
+    assert parse_course_links("<a href='/learn/x'></a><p>no courses</p>") == []
+
+
+def test_course_recommendations_are_cached_until_they_expire(coursera, monkeypatch):
+    monkeypatch.setattr(tools, "COURSE_CACHE_TTL_SECONDS", 0.5)
+    first = get_course_recommendations("Machine Learning")
+    assert "Machine Learning Basics" in first
+    # Normalized queries share the cache entry
+    assert get_course_recommendations("  machine learning? ") == first
+    assert coursera == ["Machine Learning"]
+
+    time.sleep(0.6)
+    assert get_course_recommendations("machine learning") == first
+    assert coursera == ["Machine Learning", "machine learning"]
+
+
+def test_course_searches_reuse_the_pooled_connection(coursera):
+    get_course_recommendations("machine learning")
+    get_course_recommendations("deep learning")
+    assert tools.get_http_client() is tools.get_http_client()
+    assert len(coursera) == 2
+    assert len(set(CourseraFixture.ports)) == 1
+
+
+def test_tool_calls_fetch_concurrently(coursera):
+    calls = [("get_course_recommendations", json.dumps({"query": topic}))
+             for topic in ("machine learning", "deep learning", "neural networks")]
+    started = time.perf_counter()
+    text = execute_tool_calls(calls, DOCS, 0.25)
+    elapsed = time.perf_counter() - started
+
+    assert sorted(coursera) == ["deep learning", "machine learning", "neural networks"]
+    assert elapsed < 2 * FETCH_DELAY, f"three searches took {elapsed:.2f}s"
+    # Results come back in the order the model asked for them
+    assert text.index("Machine Learning Basics") < text.index("Deep Learning Basics") < text.index("Neural Networks Basics")
+
+
+def test_async_tool_calls_fetch_concurrently(coursera):
+    calls = [("get_course_recommendations", json.dumps({"query": topic}))
+             for topic in ("machine learning", "deep learning", "neural networks")]
+    started = time.perf_counter()
+    text = asyncio.run(aexecute_tool_calls(calls, DOCS, 0.25))
+    elapsed = time.perf_counter() - started
+
+    assert len(coursera) == 3
+    assert elapsed < 2 * FETCH_DELAY, f"three searches took {elapsed:.2f}s"
+    assert text.index("Machine Learning Basics") < text.index("Neural Networks Basics")
+
+
+def test_off_topic_course_query_is_not_fetched(coursera):
+    text = execute_tool_calls([("get_course_recommendations", json.dumps({"query": "italian cooking"}))], DOCS, 0.25)
+    assert tools.OFF_TOPIC_COURSE_RESPONSE in text
+    assert coursera == []
@@ -0,0 +1,85 @@
+import hashlib
+import os
+import sys
+from functools import lru_cache
+
+# -----------------------------
+# Token counting with a cached encoder
+# -----------------------------
+DEFAULT_MODEL = "gpt-4o"
+
+# tiktoken downloads its BPE file on first use. With the file vendored here
+# (python token_counter.py --vendor, at build time) loading it is a local read.
+TIKTOKEN_VENDOR_DIR = os.getenv('TIKTOKEN_VENDOR_DIR',
+                                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'vendor', 'tiktoken'))
+
+# o200k_base for gpt-4o, cl100k_base for models tiktoken does not know. tiktoken
+# caches each BPE file under the sha1 of the URL it downloads it from.
+VENDORED_ENCODINGS = ("o200k_base", "cl100k_base")
+BPE_URL = "https://openaipublic.blob.core.windows.net/encodings/{}.tiktoken"
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model=DEFAULT_MODEL):
+    """Load the tiktoken encoding for a model once per process (tiktoken itself is imported here)."""
+    if "TIKTOKEN_CACHE_DIR" not in os.environ and os.path.isdir(TIKTOKEN_VENDOR_DIR):
+        os.environ["TIKTOKEN_CACHE_DIR"] = TIKTOKEN_VENDOR_DIR
+    import tiktoken
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def vendor_encodings(directory=TIKTOKEN_VENDOR_DIR):
+    """Download the BPE files into `directory` under the names tiktoken's cache looks for."""
+    os.makedirs(directory, exist_ok=True)
+    os.environ["TIKTOKEN_CACHE_DIR"] = directory
+    get_encoding.cache_clear()
+    import tiktoken
+    return [tiktoken.get_encoding(name).name for name in VENDORED_ENCODINGS]
+
+
+def missing_vendored_encodings(directory=TIKTOKEN_VENDOR_DIR):
+    """The encodings whose BPE file is not in `directory`, so loading them would download it."""
+    return [name for name in VENDORED_ENCODINGS
+            if not os.path.exists(os.path.join(directory, hashlib.sha1(BPE_URL.format(name).encode()).hexdigest()))]
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text, model=DEFAULT_MODEL):
+    """Token count of one string; repeated strings (roles, recent turns) hit the memo."""
+    return len(get_encoding(model).encode(text))
+
+
+def message_tokens(message, model=DEFAULT_MODEL):
+    """Token count of a chat message, using the count stored with it when available."""
+    tokens = message.get("tokens")
+    if tokens is None:
+        tokens = count_tokens(message["role"], model) + count_tokens(message["content"], model)
+    return tokens
+
+
+def num_tokens_from_messages(messages, model=DEFAULT_MODEL):
+    return sum(message_tokens(message, model) for message in messages)
+
+
+def trim_messages(messages, max_tokens):
+    """Drop the oldest messages (in place) until the rest fit in max_tokens.
+
+    Each message is counted once, reusing stored counts, and the cut point
+    is found in a single pass over a running total.
+    """
+    counts = [message_tokens(message) for message in messages]
+    total_tokens = sum(counts)
+    start = 0
+    while total_tokens > max_tokens and len(messages) - start > 1:
+        total_tokens -= counts[start]
+        start += 1
+    del messages[:start]
+    return messages
+
+
+if __name__ == "__main__":
+    if "--vendor" in sys.argv:
+        print(f"Vendored {', '.join(vendor_encodings())} into {TIKTOKEN_VENDOR_DIR}")
@@ -0,0 +1,230 @@
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+
+from config import COURSERA_BASE_URL, COURSE_CACHE_TTL_SECONDS
+from embedding_cache import normalize_query
+from relevance import is_topic_related_to_documents
+
+MAX_COURSES = 3
+MAX_PARALLEL_TOOL_CALLS = 4
+COURSE_CACHE_SIZE = 512
+
+# -----------------------------
+# Shared HTTP client
+# -----------------------------
+_http_client = None
+_http_client_lock = threading.Lock()
+
+
+def get_http_client():
+    """One pooled client per worker, so repeated scrapes reuse connections."""
+    global _http_client
+    if _http_client is None:
+        with _http_client_lock:
+            if _http_client is None:
+                import httpx  # loaded with the first tool call, not at startup
+                _http_client = httpx.Client(
+                    timeout=10,
+                    follow_redirects=True,
+                    limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+                )
+    return _http_client
+
+
+_async_http_client = None
+
+
+def get_async_http_client():
+    """Pooled async client for the async handler, created once per worker (on its event loop)."""
+    global _async_http_client
+    if _async_http_client is None:
+        import httpx
+        _async_http_client = httpx.AsyncClient(
+            timeout=10,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+        )
+    return _async_http_client
+
+
+# -----------------------------
+# Course link extraction
+# -----------------------------
+class _StopParsing(Exception):
+    pass
+
+
+class CourseLinkParser(HTMLParser):
+    """Collect course anchors without building a document tree; stops after `limit` matches."""
+
+    def __init__(self, limit=MAX_COURSES):
+        super().__init__(convert_charrefs=True)
+        self.limit = limit
+        self.courses = []
+        self._href = None
+        self._text = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag != "a" or self._href is not None:
+            return
+        href = dict(attrs).get("href")
+        if href and ('/learn/' in href or '/specializations/' in href):
+            self._href = href
+            self._text = []
+
+    def handle_data(self, data):
+        if self._href is not None:
+            self._text.append(data.strip())
+
+    def handle_endtag(self, tag):
+        if tag != "a" or self._href is None:
+            return
+        name = "".join(self._text)
+        if name:
+            self.courses.append({"name": name, "url": f"{COURSERA_BASE_URL}{self._href}", "platform": "Coursera"})
+        self._href = None
+        if len(self.courses) >= self.limit:
+            raise _StopParsing()
+
+
+def parse_course_links(html, limit=MAX_COURSES):
+    parser = CourseLinkParser(limit)
+    try:
+        parser.feed(html)
+    except _StopParsing:
+        pass
+    return parser.courses
+
+
+# -----------------------------
+# Function calling: get_course_recommendations
+# -----------------------------
+_course_cache = OrderedDict()  # normalized query -> (expires_at, result)
+_course_cache_lock = threading.Lock()
+
+
+def _format_courses(courses):
+    if not courses:
+        return "No courses found for your query."
+
+    result = "Here are some courses I found:\n"
+    for course in courses[:5]:
+        result += f"- {course['name']} ({course['platform']}): {course['url']}\n"
+    return result
+
+
+def _cached_courses(key, now):
+    with _course_cache_lock:
+        cached = _course_cache.get(key)
+        if cached is not None and cached[0] > now:
+            _course_cache.move_to_end(key)
+            return cached[1]
+    return None
+
+
+def _remember_courses(key, now, result):
+    with _course_cache_lock:
+        _course_cache[key] = (now + COURSE_CACHE_TTL_SECONDS, result)
+        _course_cache.move_to_end(key)
+        if len(_course_cache) > COURSE_CACHE_SIZE:
+            _course_cache.popitem(last=False)
+
+
+def get_course_recommendations(query):
+    key = normalize_query(query)
+    now = time.monotonic()
+    cached = _cached_courses(key, now)
+    if cached is not None:
+        return cached
+
+    # Scrape Coursera
+    try:
+        response = get_http_client().get(f"{COURSERA_BASE_URL}/search", params={"query": query})
+        response.raise_for_status()
+        courses = parse_course_links(response.text)
+    except Exception as e:
+        print(e)
+        return _format_courses([])
+
+    result = _format_courses(courses)
+    _remember_courses(key, now, result)
+    return result
+
+
+async def aget_course_recommendations(query):
+    key = normalize_query(query)
+    now = time.monotonic()
+    cached = _cached_courses(key, now)
+    if cached is not None:
+        return cached
+
+    try:
+        response = await get_async_http_client().get(f"{COURSERA_BASE_URL}/search", params={"query": query})
+        response.raise_for_status()
+        courses = parse_course_links(response.text)
+    except Exception as e:
+        print(e)
+        return _format_courses([])
+
+    result = _format_courses(courses)
+    _remember_courses(key, now, result)
+    return result
+
+
+# -----------------------------
+# Tool execution
+# -----------------------------
+OFF_TOPIC_COURSE_RESPONSE = (
+    "The topic you're asking about doesn't match the topics found in the current documents, "
+    "so I can't recommend courses on that."
+)
+
+
+def _course_query(arguments, relevant_docs, threshold):
+    """The course query, or None when it is not relevant to the retrieved docs."""
+    query = json.loads(arguments or "{}").get("query", "")
+    return query if is_topic_related_to_documents(query, relevant_docs, threshold) else None
+
+
+def _run_tool_call(name, arguments, relevant_docs, threshold):
+    if name == "get_course_recommendations":
+        query = _course_query(arguments, relevant_docs, threshold)
+        return get_course_recommendations(query) if query is not None else OFF_TOPIC_COURSE_RESPONSE
+    return None
+
+
+async def _arun_tool_call(name, arguments, relevant_docs, threshold):
+    if name == "get_course_recommendations":
+        query = _course_query(arguments, relevant_docs, threshold)
+        return await aget_course_recommendations(query) if query is not None else OFF_TOPIC_COURSE_RESPONSE
+    return None
+
+
+_tool_executor = ThreadPoolExecutor(max_workers=MAX_PARALLEL_TOOL_CALLS, thread_name_prefix="tool-call")
+
+
+def execute_tool_calls(tool_calls, relevant_docs, threshold):
+    """Run (name, arguments_json) tool calls, in parallel when there are several.
+
+    Returns the text to append to the answer, with results in the order the
+    model requested them.
+    """
+    if len(tool_calls) == 1:
+        outputs = [_run_tool_call(*tool_calls[0], relevant_docs, threshold)]
+    else:
+        futures = [_tool_executor.submit(_run_tool_call, name, arguments, relevant_docs, threshold)
+                   for name, arguments in tool_calls]
+        outputs = [future.result() for future in futures]
+    return "".join("\n\n" + output for output in outputs if output)
+
+
+async def aexecute_tool_calls(tool_calls, relevant_docs, threshold):
+    """execute_tool_calls() for the async handler: the calls run concurrently on the event loop."""
+    outputs = await asyncio.gather(*(_arun_tool_call(name, arguments, relevant_docs, threshold)
+                                     for name, arguments in tool_calls))
+    return "".join("\n\n" + output for output in outputs if output)
@@ -0,0 +1,133 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+EMBEDDINGS_FILE = "embeddings.npy"
+DOCUMENTS_FILE = "documents.json"
+IVF_FILE = "ivf.npz"
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _kmeans(matrix, n_lists, iterations=20, seed=0):
+    """Spherical k-means over unit vectors; returns (centroids, assignments)."""
+    rng = np.random.default_rng(seed)
+    centroids = matrix[rng.choice(len(matrix), size=n_lists, replace=False)].copy()
+    assignments = np.zeros(len(matrix), dtype=np.int32)
+    for iteration in range(iterations):
+        new_assignments = np.argmax(matrix @ centroids.T, axis=1).astype(np.int32)
+        if iteration > 0 and np.array_equal(new_assignments, assignments):
+            break
+        assignments = new_assignments
+        for i in range(n_lists):
+            members = matrix[assignments == i]
+            if len(members):
+                centroids[i] = members.sum(axis=0)
+        centroids = _normalize_rows(centroids)
+    return centroids.astype(np.float32), assignments
+
+
+def build_local_index(documents, embeddings, index_dir, ivf_lists=0):
+    """Write a local vector index that LocalVectorIndex can memory-map.
+
+    documents is a list of dicts with at least "content" (and optionally
+    "id"); embeddings is the matching list of vectors. Rows are stored
+    L2-normalized as float32 so cosine similarity is a plain dot product.
+    When ivf_lists > 0 the rows are also clustered for IVF search.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    matrix = _normalize_rows(np.asarray(embeddings, dtype=np.float32))
+    np.save(os.path.join(index_dir, EMBEDDINGS_FILE), matrix)
+
+    with open(os.path.join(index_dir, DOCUMENTS_FILE), "w", encoding="utf-8") as f:
+        json.dump([{"id": d.get("id"), "content": d["content"]} for d in documents], f, ensure_ascii=False)
+
+    ivf_path = os.path.join(index_dir, IVF_FILE)
+    if ivf_lists and ivf_lists < len(matrix):
+        centroids, assignments = _kmeans(matrix, ivf_lists)
+        np.savez(ivf_path, centroids=centroids, assignments=assignments)
+    elif os.path.exists(ivf_path):
+        os.remove(ivf_path)
+
+    print(f"Local vector index written to {index_dir} ({len(matrix)} documents)")
+
+
+class LocalVectorIndex:
+    """In-process top-k cosine search over a memory-mapped embedding matrix.
+
+    mode "exact" scores every row with one matrix-vector product, which is
+    the right choice for small corpora. mode "ivf" only scores the rows in
+    the nprobe clusters closest to the query, then ranks those exactly.
+    """
+
+    def __init__(self, index_dir, mode="exact", nprobe=4):
+        self.index_dir = index_dir
+        self.mode = mode
+        self.nprobe = nprobe
+
+        self.matrix = np.load(os.path.join(index_dir, EMBEDDINGS_FILE), mmap_mode="r")
+        with open(os.path.join(index_dir, DOCUMENTS_FILE), "r", encoding="utf-8") as f:
+            self.documents = json.load(f)
+
+        self.centroids = None
+        self.lists = None
+        ivf_path = os.path.join(index_dir, IVF_FILE)
+        if mode == "ivf":
+            if os.path.exists(ivf_path):
+                ivf = np.load(ivf_path)
+                self.centroids = ivf["centroids"]
+                assignments = ivf["assignments"]
+                self.lists = [np.flatnonzero(assignments == i) for i in range(len(self.centroids))]
+            else:
+                print("No IVF clusters found for local index, falling back to exact search.")
+                self.mode = "exact"
+
+    def __len__(self):
+        return len(self.documents)
+
+    def _candidates(self, query):
+        if self.mode != "ivf":
+            return None
+        nprobe = min(self.nprobe, len(self.centroids))
+        nearest = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        return np.concatenate([self.lists[i] for i in nearest])
+
+    def search(self, query_embedding, top_k=5):
+        """Return up to top_k {"content", "score"} dicts, best first."""
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        rows = self._candidates(query)
+        scores = (self.matrix @ query) if rows is None else (self.matrix[rows] @ query)
+        if rows is None:
+            rows = np.arange(len(scores))
+        if len(scores) == 0:
+            return []
+
+        k = min(top_k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [{"content": self.documents[rows[i]]["content"], "score": float(scores[i])} for i in best]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_local_index(index_dir, mode="exact", nprobe=4):
+    """Load the local index once per process."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = LocalVectorIndex(index_dir, mode=mode, nprobe=nprobe)
+                print(f"Local vector index loaded with {len(_index)} documents ({_index.mode}).")
+    return _index
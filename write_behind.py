@@ -0,0 +1,98 @@
+import atexit
+import queue
+import random
+import threading
+import time
+
+# -----------------------------
+# Write-behind queue for session writes
+# -----------------------------
+class WriteBehindQueue:
+    """Run store writes on a background thread so responses do not wait for storage.
+
+    A single worker keeps writes in submission order. Failed writes are
+    retried with jittered exponential backoff. When the queue is full the
+    caller blocks until there is room (backpressure), which keeps the order.
+    wait_for_session() lets the next turn of a session read its own writes,
+    and flush() drains the queue; it runs at interpreter exit.
+    """
+
+    def __init__(self, max_pending=1000, max_retries=5, base_delay=0.5, max_delay=10.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._pending = {}  # session_id -> writes queued or in flight
+        self._cond = threading.Condition()
+
+        self.written = 0
+        self.retried = 0
+        self.failed = 0
+        self.blocked = 0
+
+        self._worker = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._worker.start()
+        atexit.register(self.flush)
+
+    def submit(self, session_id, fn, *args):
+        with self._cond:
+            self._pending[session_id] = self._pending.get(session_id, 0) + 1
+        try:
+            self._queue.put_nowait((session_id, fn, args))
+        except queue.Full:
+            self.blocked += 1
+            self._queue.put((session_id, fn, args))
+
+    def _write(self, fn, args):
+        for attempt in range(self.max_retries + 1):
+            try:
+                fn(*args)
+                self.written += 1
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+                print(f"Session write failed ({e}), retrying in {delay:.1f}s")
+                self.retried += 1
+                time.sleep(delay)
+
+    def _done(self, session_id):
+        with self._cond:
+            remaining = self._pending.get(session_id, 1) - 1
+            if remaining:
+                self._pending[session_id] = remaining
+            else:
+                self._pending.pop(session_id, None)
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            session_id, fn, args = self._queue.get()
+            try:
+                self._write(fn, args)
+            except Exception as e:
+                self.failed += 1
+                print(f"Dropping session write for {session_id} after {self.max_retries} retries: {e}")
+            finally:
+                self._done(session_id)
+                self._queue.task_done()
+
+    def wait_for_session(self, session_id, timeout=None):
+        """Block until the session has no queued writes; returns False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: session_id not in self._pending, timeout)
+
+    def flush(self, timeout=None):
+        """Block until every queued write has been attempted; returns False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending, timeout)
+
+    def stats(self):
+        return {
+            "pending": self._queue.qsize(),
+            "written": self.written,
+            "retried": self.retried,
+            "failed": self.failed,
+            "blocked": self.blocked,
+        }